@@ -0,0 +1,131 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from engine import Klondike, shuffledDeck
+from solver import Solver, DEFAULT_MAX_NODES, DEFAULT_MAX_TIME
+
+# Solve a range of seeded deals on all cores, results are appended to csv file:
+#   seed,status,nodes,length,time,branching,passes
+# Chunks are written as a whole, an interrupted or extended run solves only seeds which are not in the file yet.
+
+HEADER = "seed,status,nodes,length,time,branching,passes\n"
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def solveChunk(task):
+    start, stop, max_nodes, max_time = task
+    solver = Solver(max_nodes, max_time)
+    game = Klondike()
+    lines = []
+    for seed in range(start, stop):
+        game.deal(shuffledDeck(seed))
+        result = solver.solve(game.piles)
+        length = len(result.moves) if result.moves is not None else 0
+        lines.append("{},{},{},{},{:.6f},{:.3f},{}\n".format(
+            seed, result.status, result.nodes, length, result.elapsed, result.branching, result.getStockPasses()))
+    return start, stop, "".join(lines)
+
+
+def mergeRanges(ranges):
+    # sorted, non overlapping (start, stop) ranges
+    merged = []
+    for range_start, range_stop in sorted(ranges):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], range_stop))
+        else:
+            merged.append((range_start, range_stop))
+    return merged
+
+
+def readDoneRanges(path):
+    # returns sorted ranges of seeds which are written, cuts off partially written last line.
+    # Chunks are written whole, so consecutive lines make ranges and there are about as many ranges as chunks
+    if not os.path.exists(path):
+        return []
+
+    ranges = []
+    run_start = run_stop = None
+    size = 0  # bytes of complete lines
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            size += len(line)
+            if not line[:1].isdigit():
+                continue
+            seed = int(line.split(b",", 1)[0])
+            if seed == run_stop:
+                run_stop += 1
+            else:
+                if run_start is not None:
+                    ranges.append((run_start, run_stop))
+                run_start, run_stop = seed, seed + 1
+    if run_start is not None:
+        ranges.append((run_start, run_stop))
+    if size != os.path.getsize(path):
+        # rare case of interrupted write
+        with open(path, "r+b") as f:
+            f.truncate(size)
+    return mergeRanges(ranges)
+
+
+def splitMissing(start, stop, done_ranges, chunk_size):
+    # chunks of seeds of [start, stop) which are not in done ranges, every chunk is a range of consecutive seeds
+    chunks = []
+    seed = start
+    for done_start, done_stop in done_ranges + [(stop, stop)]:
+        gap_stop = min(done_start, stop)
+        for chunk_start in range(seed, gap_stop, chunk_size):
+            chunks.append((chunk_start, min(chunk_start + chunk_size, gap_stop)))
+        seed = max(seed, done_stop)
+        if seed >= stop:
+            break
+    return chunks
+
+
+def run(start, stop, path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+        max_nodes=DEFAULT_MAX_NODES, max_time=DEFAULT_MAX_TIME):
+    done_ranges = readDoneRanges(path)
+    tasks = [(chunk_start, chunk_stop, max_nodes, max_time)
+             for chunk_start, chunk_stop in splitMissing(start, stop, done_ranges, chunk_size)]
+
+    if not tasks:
+        return
+
+    is_new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    solved_seeds = 0
+    total_seeds = sum(task[1] - task[0] for task in tasks)
+    start_time = time.perf_counter()
+
+    with open(path, "a") as f, multiprocessing.Pool(workers) as pool:
+        if is_new_file:
+            f.write(HEADER)
+        for chunk_start, chunk_stop, lines in pool.imap_unordered(solveChunk, tasks):
+            f.write(lines)
+            f.flush()
+
+            solved_seeds += chunk_stop - chunk_start
+            elapsed = time.perf_counter() - start_time
+            sys.stderr.write("\r{}/{} deals, {:.0f} deals/sec".format(solved_seeds, total_seeds, solved_seeds / elapsed))
+    sys.stderr.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve seeded Klondike deals on all cores")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--stop", type=int, required=True)
+    parser.add_argument("--out", default="results.csv")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to number of cores")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--max-nodes", type=int, default=DEFAULT_MAX_NODES)
+    parser.add_argument("--max-time", type=float, default=DEFAULT_MAX_TIME)
+    args = parser.parse_args()
+
+    run(args.start, args.stop, args.out, args.workers, args.chunk, args.max_nodes, args.max_time)
+
+
+if __name__ == "__main__":
+    main()
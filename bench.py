@@ -0,0 +1,467 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import types
+
+# Headless benchmarks of game logic hot paths. pyxel is replaced with a stub module,
+# so benchmarks run without display and measure python side only.
+#   python bench.py                  - run and compare with baseline
+#   python bench.py --save-baseline  - run and store results as new baseline
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_TOLERANCE = 0.2  # allowed slowdown
+DEFAULT_MIN_TIME = 0.3  # seconds per repeat
+DEFAULT_REPEATS = 5
+
+
+class StubImage:
+    def get(self, x, y):
+        return 0
+
+    def set(self, x, y, data):
+        pass
+
+    def copy(self, x, y, img, u, v, w, h):
+        pass
+
+
+def createPyxelStub():
+    stub = types.ModuleType("pyxel")
+    key_codes = {}
+    images = {}
+
+    def noop(*args, **kwargs):
+        pass
+
+    def getConstantOrFunction(name):
+        # KEY_*, MOUSE_* and other constants get unique codes, everything else does nothing
+        if name.isupper():
+            return key_codes.setdefault(name, len(key_codes) + 1)
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return noop
+
+    stub.__getattr__ = getConstantOrFunction
+    stub.frame_count = 0
+    stub.mouse_x = 0
+    stub.mouse_y = 0
+    stub.btn = lambda key: False
+    stub.btnp = lambda key, hold=0, period=0: False
+    stub.btnr = lambda key: False
+    stub.pget = lambda x, y: 0
+    stub.image = lambda img, system=False: images.setdefault(img, StubImage())
+    return stub
+
+
+def installPyxelStub():
+    sys.modules["pyxel"] = createPyxelStub()
+
+
+def measure(func, min_time, repeats):
+    # func runs one batch and returns number of operations done, best of repeats wins
+    best = 0.0
+    for _ in range(repeats):
+        ops = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            ops += func()
+            elapsed = time.perf_counter() - start
+        best = max(best, ops / elapsed)
+    return best
+
+
+def createGame():
+    import main
+
+    game = main.Game()
+    game.records_path = None
+    game.deal_pool_path = None
+    game.stats_path = None
+    game.save_path = None
+    game.winnable_deals_only = False
+    game.initialize()
+    game.reset(seed=0)
+    return game
+
+
+def benchReset():
+    game = createGame()
+    seeds = iter(range(10 ** 9))
+
+    def run():
+        for _ in range(10):
+            game.reset(seed=next(seeds))
+        return 10
+    return run
+
+
+def benchResetWinnable():
+    game = createGame()
+    game.winnable_deals_only = True
+    # same deals on every run
+    random.seed(0)
+
+    def run():
+        game.reset()
+        return 1
+    return run
+
+
+def benchResetPool():
+    import main
+
+    game = createGame()
+    game.winnable_deals_only = True
+    game.deal_pool_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), main.DEAL_POOL_PATH)
+    game.openDealPool()
+    random.seed(0)
+
+    def run():
+        for _ in range(10):
+            game.reset()
+        return 10
+    return run
+
+
+def benchNavigation():
+    game = createGame()
+    moves = [game.onMoveRight] * 13 + [game.onMoveDown, game.onMoveUp] * 4 + [game.onMoveLeft] * 13
+
+    def run():
+        for move in moves:
+            move()
+        return len(moves)
+    return run
+
+
+def benchHoldPlace():
+    game = createGame()
+    game.card_stacks[0].unselect()
+    game.card_stacks[-1].select()
+
+    def run():
+        for _ in range(50):
+            game.holdCardsToHandStack()
+            game.placeCardsFromHandStack()
+        return 100
+    return run
+
+
+def benchHandReposition():
+    import main
+
+    game = createGame()
+    hand_stack = main.HandStack()
+    for rank in reversed(range(13)):
+        hand_stack.addCard(game.createCard(rank, rank % 4))
+    card_stacks = game.card_stacks
+
+    def run():
+        for card_stack in card_stacks:
+            hand_stack.updatePositionBehindStack(card_stack)
+        return len(card_stacks)
+    return run
+
+
+def benchHitTest():
+    import main
+
+    # hover over every point of the board, one op is one hit test
+    game = createGame()
+    points = [(x, y) for x in range(0, main.WINDOW_W, 3) for y in range(0, main.WINDOW_H, 3)]
+
+    def run():
+        for x, y in points:
+            game.hitTest(x, y)
+        return len(points)
+    return run
+
+
+def benchTweens():
+    from tween import TweenPool
+
+    # all 52 cards in flight, one op is one frame of tween updates
+    game = createGame()
+    cards = [card for card_stack in game.getAllCardStacks() for card in card_stack.cards]
+    tweens = TweenPool()
+
+    def run():
+        for card in cards:
+            tweens.add(card, 0, 0, 50, 100, 30)
+        frames = 0
+        while tweens.update():
+            frames += 1
+        return frames
+    return run
+
+
+def benchDrawCardStacks():
+    # all stacks drawn on full redraw, blits are stubbed out so this is python side of card rendering
+    game = createGame()
+    for _ in range(3):
+        game.onMoveRight()
+
+    def run():
+        for _ in range(10):
+            game.drawCardStacks()
+        return 10
+    return run
+
+
+def benchGameOverFrame():
+    # full redraw of game over screen, banner text comes from the text cache
+    game = createGame()
+    game.onGameOverCheat()
+
+    def run():
+        for _ in range(10):
+            game.invalidate(True)
+            game.drawScreen()
+        return 10
+    return run
+
+
+def benchPlayback():
+    import tempfile
+    import main
+    from inputlog import writeRandomInputLog
+
+    # synthetic keys through the whole frame loop without drawing, one op is one key
+    count = 2000
+    path = os.path.join(tempfile.mkdtemp(), "bench.kdi")
+    writeRandomInputLog(path, main.SYNTHETIC_KEYS, count, seed=0, new_game_key=main.pyxel.KEY_N,
+                        new_game_every=main.SYNTHETIC_GAME_KEYS)
+
+    def run():
+        game = main.Game()
+        game.records_path = None
+        game.stats_path = None
+        game.deal_pool_path = None
+        game.startPlayback(path)
+        game.runHeadless()
+        return count
+    return run
+
+
+def benchAutosave():
+    import tempfile
+    from savegame import SaveWriter
+
+    # packing and queueing a save after a move, file writes are left to the writer thread
+    game = createGame()
+    game.save_writer = SaveWriter(os.path.join(tempfile.mkdtemp(), "bench.kdg"))
+    moves = [game.onMoveRight] * 13
+
+    def run():
+        for move in moves:
+            move()
+            game.autosave()
+        return len(moves)
+    return run
+
+
+def benchServerMove():
+    from server import SessionManager
+
+    # move requests spread over 10k sessions, every one reloads the shared engine
+    manager = SessionManager(seed=0)
+    for _ in range(10000):
+        manager.createSession()
+    rng = random.Random(0)
+    requests = []
+    for _ in range(1000):
+        session = manager.sessions[rng.randrange(1, 10001)]
+        requests.append({"op": "move", "session": session.id, "move": [0, 1, 1]})
+        requests.append({"op": "undo", "session": session.id})
+
+    def run():
+        for request in requests:
+            manager.handle(request)
+        return len(requests)
+    return run
+
+
+def benchIsGameOver():
+    game = createGame()
+
+    def run():
+        for _ in range(100):
+            game.isGameOver()
+        return 100
+    return run
+
+
+def benchLegalMoves():
+    game = createGame()
+    engine = game.engine
+
+    def run():
+        for _ in range(100):
+            engine.getLegalMoves()
+        return 100
+    return run
+
+
+def benchLegalMovesVariant():
+    from engine import Klondike, Rules, shuffledDeck
+
+    # draw-3, one redeal, any card to empty column, must keep pace with legal_moves
+    engine = Klondike(Rules(3, 1, True))
+    engine.deal(shuffledDeck(0))
+
+    def run():
+        for _ in range(100):
+            engine.getLegalMoves()
+        return 100
+    return run
+
+
+def benchApplyUndo():
+    from engine import Klondike, shuffledDeck
+
+    engine = Klondike()
+    engine.deal(shuffledDeck(0))
+    moves = engine.getLegalMoves()
+
+    def run():
+        for _ in range(100):
+            for move in moves:
+                engine.applyMove(move)
+                engine.undo()
+        return 200 * len(moves)
+    return run
+
+
+def benchAutoMove():
+    game = createGame()
+    engine = game.engine
+
+    def run():
+        for _ in range(100):
+            engine.getAutoMove()
+        return 100
+    return run
+
+
+def benchHint():
+    from hint import findBestMove
+
+    game = createGame()
+    engine = game.engine
+
+    def run():
+        # uncached evaluation, cache hits cost one packState
+        for _ in range(100):
+            findBestMove(engine)
+        return 100
+    return run
+
+
+def benchStatsSummary():
+    import tempfile
+    from engine import STANDARD_RULES
+    from stats import GameStats, HEADER, packEntry, summarize
+
+    # full scan of a journal of 100k games, one op is one folded game
+    count = 100000
+    path = os.path.join(tempfile.mkdtemp(), "bench.kds")
+    with open(path, "wb") as f:
+        f.write(HEADER)
+        for index in range(count):
+            f.write(packEntry(GameStats(index, index, 60000 + index % 1000, 100 + index % 50, STANDARD_RULES, index % 3 != 0)))
+
+    def run():
+        summarize(path)
+        return count
+    return run
+
+
+BENCHMARKS = [
+    ("reset", benchReset),
+    ("reset_winnable", benchResetWinnable),
+    ("reset_pool", benchResetPool),
+    ("navigation", benchNavigation),
+    ("hold_place", benchHoldPlace),
+    ("hand_reposition", benchHandReposition),
+    ("hit_test", benchHitTest),
+    ("tweens", benchTweens),
+    ("draw_stacks", benchDrawCardStacks),
+    ("game_over_frame", benchGameOverFrame),
+    ("playback", benchPlayback),
+    ("autosave", benchAutosave),
+    ("server_move", benchServerMove),
+    ("is_game_over", benchIsGameOver),
+    ("legal_moves", benchLegalMoves),
+    ("legal_variant", benchLegalMovesVariant),
+    ("apply_undo", benchApplyUndo),
+    ("auto_move", benchAutoMove),
+    ("hint", benchHint),
+    ("stats_summary", benchStatsSummary),
+]
+
+
+def runBenchmarks(names=None, min_time=DEFAULT_MIN_TIME, repeats=DEFAULT_REPEATS):
+    results = {}
+    for name, create in BENCHMARKS:
+        if names and name not in names:
+            continue
+        results[name] = measure(create(), min_time, repeats)
+    return results
+
+
+def compareWithBaseline(results, baseline, tolerance):
+    # returns names of benchmarks slower than baseline by more than tolerance
+    regressions = []
+    for name, ops in results.items():
+        base_ops = baseline.get(name)
+        change = ""
+        if base_ops:
+            ratio = ops / base_ops
+            change = "{:+.1f}%".format((ratio - 1) * 100)
+            if ratio < 1 - tolerance:
+                regressions.append(name)
+                change += " REGRESSION"
+        print("{:<16}{:>14.0f} ops/sec  {}".format(name, ops, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks of Klondike game logic")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all by default")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    args = parser.parse_args()
+
+    # ops/sec depend on the machine, so the baseline is not committed and has to be saved once per machine
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        sys.stderr.write("no baseline {}, run with --save-baseline first\n".format(args.baseline))
+        return 2
+
+    installPyxelStub()
+    results = runBenchmarks(args.names, args.min_time, args.repeats)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    regressions = compareWithBaseline(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 0
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
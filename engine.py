@@ -0,0 +1,641 @@
+import random
+from array import array
+
+# Headless Klondike rules engine. It knows nothing about pyxel, so it can be
+# used for batch simulation as well as a backend for the pyxel frontend.
+
+# Piles are indexed in the same order as the card stack ids of the frontend
+# (pile = card stack id - 1):
+#   [0 ][1 ]____[2 ][3 ][4 ][5 ]
+#   [6 ][7 ][8 ][9 ][10][11][12]
+STOCK = 0
+WASTE = 1
+FOUNDATION_FIRST = 2
+TABLEAU_FIRST = 6
+PILES_COUNT = 13
+
+FOUNDATIONS = range(FOUNDATION_FIRST, TABLEAU_FIRST)
+TABLEAUS = range(TABLEAU_FIRST, PILES_COUNT)
+
+# Suits (total 4):
+# 0 - clubs, 1 - diamonds, 2 - hearts, 3 - spades
+# Ranks (total 13):
+# 0 - Ace, 1 - 2, ..., 10 - Jack, 11 - Queen, 12 - King
+SUITS_COUNT = 4
+RANKS_COUNT = 13
+CARDS_COUNT = SUITS_COUNT * RANKS_COUNT
+
+ACE = 0
+KING = 12
+
+# card is encoded as one small int: suit * 13 + rank, face up cards have FACED bit set
+FACED = 0x40
+CARD_MASK = 0x3f
+
+# lookup tables indexed by encoded card (with or without FACED bit)
+CARD_RANK = [(card & CARD_MASK) % RANKS_COUNT for card in range(FACED * 2)]
+CARD_SUIT = [(card & CARD_MASK) // RANKS_COUNT for card in range(FACED * 2)]
+CARD_IS_RED = [suit == 1 or suit == 2 for suit in CARD_SUIT]
+
+# Move is a tuple (src, dst, count):
+#   (STOCK, WASTE, n)     - draw n (1, or up to 3 with draw-3 rules) cards from stock to waste
+#   (WASTE, STOCK, n)     - turn n waste cards back to stock
+#   (pile, pile, 0)       - open top face down card of tableau pile
+#   (src, dst, n)         - move n top cards from src pile to dst pile
+DRAW_MOVE = (STOCK, WASTE, 1)
+
+# History keeps every move as 2 bytes delta: (src << 4 | dst) | count << 8.
+# Delta is enough to take move back: src == dst marks opened card,
+# dst == STOCK marks waste turned over, other moves just go back.
+HISTORY_TYPECODE = "H"
+
+
+def makeCard(rank, suit):
+    return suit * RANKS_COUNT + rank
+
+
+# rank and color of card as one number, cards with same key are interchangeable on tableau
+ACCEPT_KEY = [CARD_RANK[card] * 2 + CARD_IS_RED[card] for card in range(FACED * 2)]
+# key of cards accepted by face up tableau top card
+TOP_ACCEPT_KEY = [(key - 2) ^ 1 for key in ACCEPT_KEY]
+ACCEPT_KEY_CARDS = [
+    tuple(card for card in range(CARDS_COUNT) if ACCEPT_KEY[card] == key)
+    for key in range(RANKS_COUNT * 2)
+]
+KINGS = tuple(makeCard(KING, suit) for suit in range(SUITS_COUNT))
+ALL_CARDS = tuple(range(CARDS_COUNT))
+FULL_FOUNDATION_RANKS = [RANKS_COUNT] * SUITS_COUNT
+
+
+def cardRank(card):
+    return CARD_RANK[card]
+
+
+def cardSuit(card):
+    return CARD_SUIT[card]
+
+
+def isFaced(card):
+    return bool(card & FACED)
+
+
+def checkPlaceToNotEmptyPile(card, top_card, pile):
+    if pile >= TABLEAU_FIRST:
+        if CARD_RANK[card] != CARD_RANK[top_card] - 1:
+            return False
+
+        return CARD_IS_RED[card] != CARD_IS_RED[top_card]
+    elif pile >= FOUNDATION_FIRST:
+        if CARD_RANK[card] != CARD_RANK[top_card] + 1:
+            return False
+
+        return CARD_SUIT[card] == CARD_SUIT[top_card]
+    return False
+
+
+def checkPlaceToEmptyPile(card, pile):
+    if pile >= TABLEAU_FIRST:
+        return CARD_RANK[card] == KING
+    elif pile >= FOUNDATION_FIRST:
+        return CARD_RANK[card] == ACE
+    return False
+
+
+def checkPlaceAnyToEmptyPile(card, pile):
+    if pile >= TABLEAU_FIRST:
+        return True
+    elif pile >= FOUNDATION_FIRST:
+        return CARD_RANK[card] == ACE
+    return False
+
+
+class Rules:
+    # Rule variants, resolved once by Klondike.setRules:
+    #   draw_count        - cards drawn from stock at once, 1 or 3
+    #   max_redeals       - times waste can be turned over, None for unlimited
+    #   is_any_to_empty   - any card (not only king) can go to empty tableau pile
+    def __init__(self, draw_count=1, max_redeals=None, is_any_to_empty=False):
+        if draw_count not in (1, 3):
+            raise ValueError("draw count must be 1 or 3, got {}".format(draw_count))
+        if max_redeals is not None and not 0 <= max_redeals < MAX_REDEALS_CODE:
+            raise ValueError("redeals must be in 0..{}, got {}".format(MAX_REDEALS_CODE - 1, max_redeals))
+        self.draw_count = draw_count
+        self.max_redeals = max_redeals
+        self.is_any_to_empty = is_any_to_empty
+
+    def __eq__(self, other):
+        return isinstance(other, Rules) and self.pack() == other.pack()
+
+    def __hash__(self):
+        return self.pack()
+
+    def isStandard(self):
+        return self.pack() == STANDARD_RULES_CODE
+
+    def pack(self):
+        # one byte: draw count - 1 (bits 0-1), any to empty (bit 2), redeals + 1 or 0 (bits 3-7)
+        redeals = 0 if self.max_redeals is None else self.max_redeals + 1
+        return (self.draw_count - 1) | self.is_any_to_empty << 2 | redeals << 3
+
+    @classmethod
+    def unpack(cls, code):
+        redeals = code >> 3
+        return cls((code & 3) + 1, redeals - 1 if redeals else None, bool(code & 4))
+
+
+MAX_REDEALS_CODE = 31
+STANDARD_RULES_CODE = 0
+STANDARD_RULES = Rules()
+
+
+def packMove(move):
+    src, dst, count = move
+    return src << 4 | dst | count << 8
+
+
+def unpackMove(delta):
+    return (delta >> 4) & 0xf, delta & 0xf, delta >> 8
+
+
+def newDeck():
+    return [makeCard(rank, suit) for suit in range(SUITS_COUNT) for rank in range(RANKS_COUNT)]
+
+
+def shuffledDeck(seed):
+    # same seed gives same deal on any machine and in any process
+    cards = newDeck()
+    random.Random(seed).shuffle(cards)
+    return cards
+
+
+class Klondike:
+    def __init__(self, rules=STANDARD_RULES):
+        self.piles = [[] for _ in range(PILES_COUNT)]
+        self.history = array(HISTORY_TYPECODE)
+        self.redo_history = array(HISTORY_TYPECODE)
+        self.deal_cards = None
+        self.redeals = 0
+        self.setRules(rules)
+        self.rebuildIndexes()
+
+    def setRules(self, rules):
+        # rule checks are chosen here once, moves never look at rule flags
+        self.rules = rules
+        self.draw_count = rules.draw_count
+        # redeals counter never reaches -1, so unlimited redeals need no extra check
+        self.redeals_limit = rules.max_redeals if rules.max_redeals is not None else -1
+        self.checkPlaceToEmptyPile = checkPlaceAnyToEmptyPile if rules.is_any_to_empty else checkPlaceToEmptyPile
+        self.empty_tableau_cards = ALL_CARDS if rules.is_any_to_empty else KINGS
+        # auto complete through stock is always possible only with draw-1 and unlimited redeals
+        self.is_stock_auto_completable = rules.draw_count == 1 and rules.max_redeals is None
+
+    def deal(self, cards=None, rng=random):
+        if cards is None:
+            cards = newDeck()
+            rng.shuffle(cards)
+
+        # same layout as the frontend: all cards go to stock, the last one is on top,
+        # then tableau piles are dealt from the top of the stock
+        stock = list(cards)
+        piles = [[] for _ in range(PILES_COUNT)]
+        for counter, pile in enumerate(TABLEAUS, 1):
+            for i in range(counter):
+                card = stock.pop()
+                if i == counter - 1:
+                    card |= FACED
+                piles[pile].append(card)
+        piles[STOCK] = stock
+
+        self.piles = piles
+        self.history = array(HISTORY_TYPECODE)
+        self.redo_history = array(HISTORY_TYPECODE)
+        self.deal_cards = list(cards)
+        self.redeals = 0
+        self.rebuildIndexes()
+
+    def setPiles(self, piles, redeals=0):
+        self.piles = [list(pile) for pile in piles]
+        self.history = array(HISTORY_TYPECODE)
+        self.redo_history = array(HISTORY_TYPECODE)
+        self.deal_cards = None
+        self.redeals = redeals
+        self.rebuildIndexes()
+
+    def rebuildIndexes(self):
+        # Indexes kept up to date by every move, so legal moves are found by lookups:
+        #   card_piles, card_indexes - where every card lies
+        #   faced_indexes            - index of first face up card of tableau pile
+        #   foundation_ranks         - number of cards of every suit on foundations
+        #   suit_foundations         - foundation pile of every suit or None
+        #   accepting                - (rank, color) key -> tableau piles accepting such card
+        #   tableau_tops             - face up top card of tableau pile or None
+        piles = self.piles
+        self.card_piles = [STOCK] * CARDS_COUNT
+        self.card_indexes = [0] * CARDS_COUNT
+        for pile, cards in enumerate(piles):
+            for index, card in enumerate(cards):
+                self.card_piles[card & CARD_MASK] = pile
+                self.card_indexes[card & CARD_MASK] = index
+
+        self.faced_indexes = [0] * PILES_COUNT
+        for pile in TABLEAUS:
+            cards = piles[pile]
+            index = len(cards)
+            while index and cards[index - 1] & FACED:
+                index -= 1
+            self.faced_indexes[pile] = index
+
+        self.foundation_ranks = [0] * SUITS_COUNT
+        self.suit_foundations = [None] * SUITS_COUNT
+        for pile in FOUNDATIONS:
+            if piles[pile]:
+                suit = CARD_SUIT[piles[pile][0]]
+                self.foundation_ranks[suit] = len(piles[pile])
+                self.suit_foundations[suit] = pile
+
+        self.accepting = {}
+        self.tableau_tops = [None] * PILES_COUNT
+        for pile in TABLEAUS:
+            self.updateTableauTop(pile)
+
+    def updateTableauTop(self, pile):
+        old_top = self.tableau_tops[pile]
+        cards = self.piles[pile]
+        top = cards[-1] if cards and cards[-1] & FACED else None
+        if top == old_top:
+            return
+
+        if old_top is not None and CARD_RANK[old_top] != ACE:
+            key = TOP_ACCEPT_KEY[old_top]
+            piles = self.accepting[key]
+            piles.discard(pile)
+            if not piles:
+                del self.accepting[key]
+        if top is not None and CARD_RANK[top] != ACE:
+            self.accepting.setdefault(TOP_ACCEPT_KEY[top], set()).add(pile)
+        self.tableau_tops[pile] = top
+
+    def getAcceptingPiles(self, card):
+        # tableau piles where card can be placed on face up top card
+        return self.accepting.get(ACCEPT_KEY[card], ())
+
+    def isWon(self):
+        return self.foundation_ranks == FULL_FOUNDATION_RANKS
+
+    def getFoundationRanks(self):
+        # number of cards of every suit already on foundations
+        return list(self.foundation_ranks)
+
+    def getMovableCount(self, card):
+        # number of cards moved together when card is picked up, 0 if card can not be moved
+        pile = self.card_piles[card]
+        index = self.card_indexes[card]
+        length = len(self.piles[pile])
+        if pile >= TABLEAU_FIRST:
+            return length - index if index >= self.faced_indexes[pile] else 0
+        if pile == STOCK or index != length - 1:
+            return 0
+        return 1
+
+    def getSafeFoundationMove(self):
+        # card is safe to put on foundation when both opposite color cards
+        # of previous rank are already there, so no tableau card can need it
+        ranks = self.foundation_ranks
+        red_rank = min(ranks[1], ranks[2])
+        black_rank = min(ranks[0], ranks[3])
+
+        for suit in range(SUITS_COUNT):
+            rank = ranks[suit]
+            if rank == RANKS_COUNT:
+                continue
+            if rank > 1 and rank > (black_rank if suit == 1 or suit == 2 else red_rank):
+                continue
+            move = self.getFoundationMoveOfSuit(suit)
+            if move is not None:
+                return move
+        return None
+
+    def getFoundationMove(self):
+        # any waste or tableau top card which can go to foundation, safe or not
+        for suit in range(SUITS_COUNT):
+            if self.foundation_ranks[suit] == RANKS_COUNT:
+                continue
+            move = self.getFoundationMoveOfSuit(suit)
+            if move is not None:
+                return move
+        return None
+
+    def getFoundationMoveOfSuit(self, suit):
+        # next card of suit goes to foundation only from waste or tableau top
+        card = suit * RANKS_COUNT + self.foundation_ranks[suit]
+        src = self.card_piles[card]
+        if src == STOCK or FOUNDATION_FIRST <= src < TABLEAU_FIRST:
+            return None
+        if self.getMovableCount(card) != 1:
+            return None
+        return (src, self.getFoundationPile(suit), 1)
+
+    def canAutoComplete(self):
+        # with every tableau card face up the game is always won by playing the lowest
+        # cards to foundations (they are on tableau tops) and cycling the stock
+        if not self.is_stock_auto_completable and (self.piles[STOCK] or self.piles[WASTE]):
+            return False
+        faced_indexes = self.faced_indexes
+        for pile in TABLEAUS:
+            if faced_indexes[pile]:
+                return False
+        return True
+
+    def getAutoMove(self):
+        # safe foundation move, once game can be auto completed also any foundation move
+        # or stock move; None when there is nothing to play automatically
+        move = self.getSafeFoundationMove()
+        if move is not None or not self.canAutoComplete():
+            return move
+
+        move = self.getFoundationMove()
+        if move is not None:
+            return move
+
+        return self.getStockMove()
+
+    def autoComplete(self, max_moves=None):
+        # plays automatic moves until there are none left, returns played moves
+        moves = []
+        while max_moves is None or len(moves) < max_moves:
+            move = self.getAutoMove()
+            if move is None:
+                break
+            self.applyMove(move)
+            moves.append(move)
+        return moves
+
+    def getDrawMove(self):
+        return (STOCK, WASTE, min(self.draw_count, len(self.piles[STOCK])))
+
+    def canRedeal(self):
+        return self.redeals != self.redeals_limit
+
+    def getStockMove(self):
+        # draw, or turn waste over when stock is empty, None if neither is possible
+        piles = self.piles
+        if piles[STOCK]:
+            return self.getDrawMove()
+        if piles[WASTE] and self.redeals != self.redeals_limit:
+            return (WASTE, STOCK, len(piles[WASTE]))
+        return None
+
+    def getFoundationPile(self, suit):
+        # foundation pile where card of suit goes
+        dst = self.suit_foundations[suit]
+        if dst is not None:
+            return dst
+        for dst in FOUNDATIONS:
+            if not self.piles[dst]:
+                return dst
+        return None
+
+    def isLegalMove(self, move):
+        src, dst, count = move
+        piles = self.piles
+
+        if src == dst:
+            # open card
+            pile = piles[src]
+            return count == 0 and src >= TABLEAU_FIRST and bool(pile) and not pile[-1] & FACED
+
+        if src == STOCK:
+            return dst == WASTE and bool(piles[STOCK]) and count == min(self.draw_count, len(piles[STOCK]))
+
+        if dst == STOCK:
+            return (src == WASTE and not piles[STOCK] and count == len(piles[WASTE]) and count > 0
+                    and self.redeals != self.redeals_limit)
+
+        if dst == WASTE:
+            return False
+
+        src_pile = piles[src]
+        if count < 1 or count > len(src_pile):
+            return False
+
+        # only tableau runs can be moved as a whole, other piles give top card only
+        if count > 1 and (src < TABLEAU_FIRST or dst < TABLEAU_FIRST):
+            return False
+
+        card = src_pile[-count]
+        if not card & FACED:
+            return False
+
+        dst_pile = piles[dst]
+        if dst_pile:
+            top_card = dst_pile[-1]
+            if not top_card & FACED:
+                return False
+            return checkPlaceToNotEmptyPile(card, top_card, dst)
+        return self.checkPlaceToEmptyPile(card, dst)
+
+    def applyMove(self, move):
+        # move must be legal, use makeMove for unchecked input
+        self.doMove(move)
+        self.history.append(packMove(move))
+        if self.redo_history:
+            del self.redo_history[:]
+
+    def doMove(self, move):
+        src, dst, count = move
+        piles = self.piles
+
+        if src == dst:
+            piles[src][-1] |= FACED
+            self.faced_indexes[src] -= 1
+            self.updateTableauTop(src)
+        elif src == STOCK:
+            # cards are drawn one by one, so with draw-3 the third card ends up on top
+            stock = piles[STOCK]
+            waste = piles[WASTE]
+            for _ in range(count):
+                card = stock.pop()
+                self.card_piles[card] = WASTE
+                self.card_indexes[card] = len(waste)
+                waste.append(card | FACED)
+        elif dst == STOCK:
+            waste = piles[WASTE]
+            stock = piles[STOCK]
+            stock[:] = [card & CARD_MASK for card in reversed(waste)]
+            del waste[:]
+            self.setPileIndexes(STOCK, 0)
+            self.redeals += 1
+        else:
+            self.moveCards(src, dst, count)
+
+    def moveCards(self, src, dst, count):
+        piles = self.piles
+        src_pile = piles[src]
+        dst_pile = piles[dst]
+        dst_length = len(dst_pile)
+        dst_pile += src_pile[-count:]
+        del src_pile[-count:]
+        self.setPileIndexes(dst, dst_length)
+
+        if src >= TABLEAU_FIRST:
+            if self.faced_indexes[src] > len(src_pile):
+                self.faced_indexes[src] = len(src_pile)
+            self.updateTableauTop(src)
+        elif src >= FOUNDATION_FIRST:
+            suit = CARD_SUIT[dst_pile[-1]]
+            self.foundation_ranks[suit] -= 1
+            if not src_pile:
+                self.suit_foundations[suit] = None
+
+        if dst >= TABLEAU_FIRST:
+            self.updateTableauTop(dst)
+        elif dst >= FOUNDATION_FIRST:
+            suit = CARD_SUIT[dst_pile[-1]]
+            self.foundation_ranks[suit] += 1
+            self.suit_foundations[suit] = dst
+
+    def setPileIndexes(self, pile, start):
+        card_piles = self.card_piles
+        card_indexes = self.card_indexes
+        cards = self.piles[pile]
+        for index in range(start, len(cards)):
+            card = cards[index] & CARD_MASK
+            card_piles[card] = pile
+            card_indexes[card] = index
+
+    def makeMove(self, move):
+        if not self.isLegalMove(move):
+            return False
+
+        self.applyMove(move)
+        return True
+
+    def getMoves(self):
+        return [unpackMove(delta) for delta in self.history]
+
+    def getMovesCount(self):
+        return len(self.history)
+
+    def canUndo(self):
+        return bool(self.history)
+
+    def canRedo(self):
+        return bool(self.redo_history)
+
+    def undo(self):
+        if not self.history:
+            return None
+
+        delta = self.history.pop()
+        self.redo_history.append(delta)
+        move = unpackMove(delta)
+        self.undoMove(move)
+        return move
+
+    def redo(self):
+        if not self.redo_history:
+            return None
+
+        delta = self.redo_history.pop()
+        self.history.append(delta)
+        move = unpackMove(delta)
+        self.doMove(move)
+        return move
+
+    def rewind(self, moves_count):
+        # go back (or forward along redo history) to state after first moves_count moves
+        while len(self.history) > moves_count:
+            self.undo()
+        while len(self.history) < moves_count and self.redo_history:
+            self.redo()
+
+    def undoMove(self, move):
+        src, dst, count = move
+        piles = self.piles
+
+        if src == dst:
+            piles[src][-1] &= CARD_MASK
+            self.faced_indexes[src] += 1
+            self.updateTableauTop(src)
+        elif src == STOCK:
+            stock = piles[STOCK]
+            waste = piles[WASTE]
+            for _ in range(count):
+                card = waste.pop() & CARD_MASK
+                self.card_piles[card] = STOCK
+                self.card_indexes[card] = len(stock)
+                stock.append(card)
+        elif dst == STOCK:
+            stock = piles[STOCK]
+            piles[WASTE][:] = [card | FACED for card in reversed(stock)]
+            del stock[:]
+            self.setPileIndexes(WASTE, 0)
+            self.redeals -= 1
+        else:
+            self.moveCards(dst, src, count)
+
+    def getLegalMoves(self):
+        # every lookup below is constant, so time depends on number of moves, not cards
+        piles = self.piles
+        card_piles = self.card_piles
+        moves = []
+
+        stock_move = self.getStockMove()
+        if stock_move is not None:
+            moves.append(stock_move)
+
+        empty_tableaus = []
+        for pile in TABLEAUS:
+            length = len(piles[pile])
+            if not length:
+                empty_tableaus.append(pile)
+            elif self.faced_indexes[pile] == length:
+                moves.append((pile, pile, 0))
+
+        # to foundations
+        empty_foundations = [pile for pile in FOUNDATIONS if not piles[pile]]
+        for suit in range(SUITS_COUNT):
+            rank = self.foundation_ranks[suit]
+            if rank == RANKS_COUNT:
+                continue
+            card = suit * RANKS_COUNT + rank
+            if self.getMovableCount(card) != 1:
+                continue
+            src = card_piles[card]
+            if rank == ACE:
+                for dst in empty_foundations:
+                    if dst != src:
+                        moves.append((src, dst, 1))
+            else:
+                moves.append((src, self.suit_foundations[suit], 1))
+
+        # ace from one foundation to another
+        if empty_foundations:
+            for src in FOUNDATIONS:
+                if len(piles[src]) == 1:
+                    for dst in empty_foundations:
+                        moves.append((src, dst, 1))
+
+        # to tableau piles with face up top card
+        for key, dst_piles in self.accepting.items():
+            for card in ACCEPT_KEY_CARDS[key]:
+                count = self.getMovableCount(card)
+                if not count:
+                    continue
+                src = card_piles[card]
+                for dst in dst_piles:
+                    if dst != src:
+                        moves.append((src, dst, count))
+
+        # kings (or any cards, depending on rules) to empty tableau piles
+        if empty_tableaus:
+            for card in self.empty_tableau_cards:
+                count = self.getMovableCount(card)
+                if not count:
+                    continue
+                src = card_piles[card]
+                for dst in empty_tableaus:
+                    if dst != src:
+                        moves.append((src, dst, count))
+
+        return moves
@@ -0,0 +1,113 @@
+from engine import (
+    STOCK, WASTE, FOUNDATION_FIRST, TABLEAU_FIRST, FACED, CARD_RANK, CARD_IS_RED, SUITS_COUNT, RANKS_COUNT
+)
+from state import packState
+from solver import canPlayToFoundation
+
+# Hints: every legal move gets a heuristic score, the best one is the hint.
+# Scoring only looks at the move and the piles around it, so it takes microseconds,
+# and best moves are memoized by packed state, so unchanged states never recompute.
+# With limited redeals the redeals count is part of the state, like in solver, and rules changes clear the cache.
+
+FLIP_SCORE = 100
+SAFE_FOUNDATION_SCORE = 95
+FOUNDATION_SCORE = 90
+REVEAL_SCORE = 80
+EMPTY_COLUMN_SCORE = 70
+WASTE_SCORE = 60
+FREE_FOUNDATION_CARD_SCORE = 50
+DRAW_SCORE = 30
+RECYCLE_SCORE = 20
+FROM_FOUNDATION_SCORE = 5
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def isSafeFoundationCard(game, card):
+    # both opposite color cards of previous rank are on foundations already
+    rank = CARD_RANK[card]
+    if rank <= 1:
+        return True
+    ranks = game.foundation_ranks
+    is_red = CARD_IS_RED[card]
+    for suit in range(SUITS_COUNT):
+        if CARD_IS_RED[suit * RANKS_COUNT] != is_red and ranks[suit] < rank:
+            return False
+    return True
+
+
+def scoreMove(game, move):
+    # higher is better, None for moves which are never worth a hint
+    src, dst, count = move
+    piles = game.piles
+
+    if src == dst:
+        return FLIP_SCORE
+    if src == STOCK:
+        return DRAW_SCORE
+    if dst == STOCK:
+        return RECYCLE_SCORE
+
+    src_pile = piles[src]
+    if dst < TABLEAU_FIRST:
+        if src >= FOUNDATION_FIRST and src < TABLEAU_FIRST:
+            # ace from one foundation to another changes nothing
+            return None
+        score = SAFE_FOUNDATION_SCORE if isSafeFoundationCard(game, src_pile[-1]) else FOUNDATION_SCORE
+        if src >= TABLEAU_FIRST and len(src_pile) > 1 and not src_pile[-2] & FACED:
+            score += 1
+        return score
+    if src < TABLEAU_FIRST:
+        return WASTE_SCORE if src == WASTE else FROM_FOUNDATION_SCORE
+
+    if count == len(src_pile):
+        if not piles[dst]:
+            # king with nothing under it to another empty column
+            return None
+        return EMPTY_COLUMN_SCORE
+    under_card = src_pile[-count - 1]
+    if not under_card & FACED:
+        # prefer columns with more hidden cards
+        return REVEAL_SCORE + game.faced_indexes[src]
+    if canPlayToFoundation(game, under_card):
+        return FREE_FOUNDATION_CARD_SCORE
+    return None
+
+
+def findBestMove(game):
+    best_move = None
+    best_score = None
+    for move in game.getLegalMoves():
+        score = scoreMove(game, move)
+        if score is not None and (best_score is None or score > best_score):
+            best_move = move
+            best_score = score
+    return best_move
+
+
+class Hinter:
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = {}
+        self.rules = None  # rules of cached hints
+        self.hits = 0
+        self.misses = 0
+
+    def getHint(self, game):
+        # best move for current piles of engine game, None if there are no useful moves
+        if game.rules != self.rules:
+            self.cache.clear()
+            self.rules = game.rules
+        key = packState(game.piles)
+        if game.rules.max_redeals is not None:
+            key += bytes([game.redeals])
+        if key in self.cache:
+            self.hits += 1
+            return self.cache[key]
+
+        self.misses += 1
+        move = findBestMove(game)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[key] = move
+        return move
@@ -0,0 +1,140 @@
+import random
+import struct
+from collections import deque
+
+from engine import Rules, STANDARD_RULES
+
+# Input log of a game session, for reproducing sessions and load testing the game loop:
+#   header  - b"KLDI" + version byte + packed rules byte
+#   entries - frame, event code, value (<IHI)
+# Keys are logged with their pyxel codes, mouse events with x, y packed to value,
+# and every dealt seed, so playback deals the same games without depending on random or solver time.
+MAGIC = b"KLDI"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+ENTRY_FORMAT = struct.Struct("<IHI")
+
+MOUSE_PRESS_CODE = 0xfff0
+MOUSE_RELEASE_CODE = 0xfff1
+MOUSE_MOVE_CODE = 0xfff2
+DEAL_CODE = 0xfff3
+READ_CHUNK_ENTRIES = 4096
+
+
+class InputLogError(Exception):
+    pass
+
+
+def packPosition(x, y):
+    return (x & 0xffff) | (y & 0xffff) << 16
+
+
+def unpackPosition(value):
+    x = value & 0xffff
+    y = value >> 16
+    # screen coordinates are small, negative ones wrap around
+    return x - 0x10000 if x & 0x8000 else x, y - 0x10000 if y & 0x8000 else y
+
+
+class InputRecorder:
+    def __init__(self, path, rules=STANDARD_RULES):
+        self.file = open(path, "wb")
+        self.file.write(HEADER + bytes([rules.pack()]))
+
+    def write(self, frame, code, value=0):
+        self.file.write(ENTRY_FORMAT.pack(frame, code, value))
+
+    def writeKey(self, frame, key):
+        self.write(frame, key)
+
+    def writeMouse(self, frame, code, x, y):
+        self.write(frame, code, packPosition(x, y))
+
+    def writeDeal(self, frame, seed):
+        self.write(frame, DEAL_CODE, seed)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def readInputLog(path):
+    # (rules, list of (frame, code, value)), a partially written last entry is skipped
+    with open(path, "rb") as f:
+        header = f.read(len(HEADER) + 1)
+        if len(header) != len(HEADER) + 1 or header[:len(HEADER)] != HEADER:
+            raise InputLogError("{} is not an input log file".format(path))
+        try:
+            rules = Rules.unpack(header[-1])
+        except ValueError as error:
+            raise InputLogError("bad rules in {}: {}".format(path, error))
+
+        entries = []
+        while True:
+            data = f.read(READ_CHUNK_ENTRIES * ENTRY_FORMAT.size)
+            data = data[:len(data) - len(data) % ENTRY_FORMAT.size]
+            if not data:
+                return rules, entries
+            entries.extend(ENTRY_FORMAT.iter_unpack(data))
+
+
+class InputPlayer:
+    # feeds logged events to game at the frames they were logged at
+    def __init__(self, rules, entries, stop_key=None):
+        self.rules = rules
+        self.entries = [entry for entry in entries if entry[1] != DEAL_CODE]
+        self.deal_seeds = deque(value for frame, code, value in entries if code == DEAL_CODE)
+        self.position = 0
+        self.stop_key = stop_key  # quit key ends playback instead of being played
+
+    @staticmethod
+    def load(path, stop_key=None):
+        rules, entries = readInputLog(path)
+        return InputPlayer(rules, entries, stop_key)
+
+    def isDone(self):
+        return self.position >= len(self.entries)
+
+    def getLastFrame(self):
+        return self.entries[-1][0] if self.entries else 0
+
+    def nextDealSeed(self):
+        return self.deal_seeds.popleft() if self.deal_seeds else None
+
+    def feed(self, game, frame):
+        entries = self.entries
+        position = self.position
+        while position < len(entries) and entries[position][0] <= frame:
+            entry_frame, code, value = entries[position]
+            position += 1
+            if code == MOUSE_MOVE_CODE:
+                game.moveMouse(*unpackPosition(value))
+            elif code == MOUSE_PRESS_CODE or code == MOUSE_RELEASE_CODE:
+                game.postEvent((code,) + unpackPosition(value))
+            elif code == self.stop_key:
+                position = len(entries)
+            else:
+                game.postEvent(code)
+        self.position = position
+
+
+def writeRandomInputLog(path, keys, count, rules=STANDARD_RULES, seed=None, frames_per_key=2, new_game_key=None,
+                        new_game_every=None):
+    # synthetic session of count random keys, optionally with a new game every new_game_every keys
+    rng = random.Random(seed)
+    with InputRecorder(path, rules) as recorder:
+        recorder.writeDeal(0, rng.randrange(2 ** 32))
+        frame = 0
+        for index in range(count):
+            frame += frames_per_key
+            if new_game_key is not None and new_game_every and index % new_game_every == new_game_every - 1:
+                recorder.writeKey(frame, new_game_key)
+                recorder.writeDeal(frame, rng.randrange(2 ** 32))
+            else:
+                recorder.writeKey(frame, rng.choice(keys))
+
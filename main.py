@@ -1,12 +1,105 @@
+import argparse
+import os
 import pyxel
 import random
+import sys
+import time
+from collections import deque
+
+from engine import Klondike, Rules, STOCK, STANDARD_RULES, RANKS_COUNT, cardRank, cardSuit, isFaced, shuffledDeck
+from state import CompactState
+from solver import solve, DEFAULT_MAX_TIME
+from hint import Hinter
+from inputlog import InputPlayer, InputRecorder, MOUSE_PRESS_CODE, MOUSE_RELEASE_CODE, MOUSE_MOVE_CODE, writeRandomInputLog
+from pool import DealPool, PoolError
+from record import RecordStore, recordGame
+from savegame import SavedGame, SaveWriter, loadSave, packSave
+from stats import GameStats, StatsError, StatsStore, formatSummary
+from textcache import TextCache
+from tween import TweenPool
+from profiler import Profiler, UPDATE, NODES_UPDATE, DRAW, CARD_BLITS, TEXT, GAME_OVER
 
 # constants
 WINDOW_W = 120
 WINDOW_H = 180
 COLKEY = 0
+CARD_W = 16
 CARD_H = 16
 CHAR_W = 4
+MAX_DEAL_ATTEMPTS = 10
+DEAL_SEARCH_TIME = 0.25  # seconds the frame loop may spend solving deals of a new game
+MAX_SEED = 2 ** 32
+RECORDS_PATH = "games.kdr"
+DEAL_POOL_PATH = "assets/deals.kdp"
+STATS_PATH = "stats.kds"
+SAVE_PATH = "game.kdg"
+
+# retained render: backgrounds with help text are baked to this image bank,
+# controls info at u = 0 and instructions at u = WINDOW_W
+BACKGROUND_BANK = 2
+COLUMNS_COUNT = 7
+COLUMN_W = 17
+AUTO_MOVE_FRAMES = 3  # frames between animated auto complete moves
+MOVE_FRAMES = 6  # card flight between piles
+DEAL_FRAMES = 8
+DEAL_DELAY_FRAMES = 1  # between cards of deal cascade
+WIN_FRAMES = 24
+WIN_DELAY_FRAMES = 2
+MOUSE_PRESS = MOUSE_PRESS_CODE  # mouse events are queued with keys as (event, x, y)
+MOUSE_RELEASE = MOUSE_RELEASE_CODE
+DRAG_DISTANCE = 3  # pixels pressed mouse moves before cards are dragged
+# synthetic input logs: game keys in random order, new game every SYNTHETIC_GAME_KEYS keys
+SYNTHETIC_KEYS = [pyxel.KEY_RIGHT, pyxel.KEY_LEFT, pyxel.KEY_UP, pyxel.KEY_DOWN, pyxel.KEY_ENTER, pyxel.KEY_SPACE,
+                  pyxel.KEY_ESCAPE, pyxel.KEY_U, pyxel.KEY_R, pyxel.KEY_A, pyxel.KEY_H]
+SYNTHETIC_GAME_KEYS = 500
+
+# help screens, baked to background bank with retained render
+HELP_COL = 3
+CONTROLS_MSG = """   KEYBOARD CONTROLLS
+   - - - - + - - - - 
+ 
+    ARROWS - MOVE
+     MOUSE - DRAG/CLICK
+   <SPACE> - HOLD/PLACE
+   <ENTER> - HOLD/PLACE
+     <ESC> - DROP
+   <U>/<R> - UNDO/REDO
+       <A> - AUTO PLAY
+       <H> - HINT
+       <N> - NEW GAME
+       <S> - STATS
+       <I> - GAME  (!)
+             RULES
+       <Q> - EXIT"""
+
+INSTRUCTIONS_MSG = """
+           RULES
+           - + -
+
+To win Klondike Solitaire 
+you must move all the cards
+to the four goals. Each
+foundation can only hold
+one suit and you must put
+the cards sequencing from
+Ace to King: Ace, 2, 3, 4,
+5, 6, 7, 8, 9, Jack, Queen
+and King. You have to
+complete all suits to win
+the game: clubs, diamonds,
+hearts and spades. 
+
+   <I> - SHOW CONTROLLS"""
+
+GAME_OVER_MSG = "G A M E   O V E R"
+GAME_OVER_COL = 15
+GAME_OVER_OUTLINE_COL = 1
+STATS_COL = 7
+
+AUTO_COMPLETE_OFF = "off"
+AUTO_COMPLETE_ANIMATED = "animated"
+AUTO_COMPLETE_INSTANT = "instant"
+AUTO_COMPLETE_MODES = [AUTO_COMPLETE_ANIMATED, AUTO_COMPLETE_INSTANT, AUTO_COMPLETE_OFF]
 
 
 def setupCardStack(card_stack, row, col, id):
@@ -48,20 +141,54 @@ class Card(Node):
         self.is_focus = False
         self.is_selected = False
 
+        # animation offset from layout position, driven by TweenPool
+        self.offset_x = 0
+        self.offset_y = 0
+        self.tween_index = -1
+
     def draw(self):
+        x = self.x + self.offset_x
+        y = self.y + self.offset_y
         if self.is_faced is True:
-            super().draw()
+            pyxel.blt(x, y, self.image, self.u, self.v, self.w, self.h, COLKEY)
             if self.is_selected is True:
-                pyxel.blt(self.x, self.y, 0, 16 * 3, 16 * 4, 16, 16, COLKEY)
+                pyxel.blt(x, y, 0, 16 * 3, 16 * 4, 16, 16, COLKEY)
         else:
-            pyxel.blt(self.x, self.y, self.image, 0, 16 * 4, self.w, self.h, COLKEY)
+            pyxel.blt(x, y, self.image, 0, 16 * 4, self.w, self.h, COLKEY)
 
         if self.is_focus is True:
-            pyxel.blt(self.x, self.y, 0, 16 * 2, 16 * 4, 16, 16, COLKEY)
+            pyxel.blt(x, y, 0, 16 * 2, 16 * 4, 16, 16, COLKEY)
 
     def getHeight(self):
         return self.h
 
+    def isInPlace(self):
+        return self.tween_index < 0 and not self.offset_x and not self.offset_y
+
+
+class Cursor:
+    # the only focus of the game: card stack and index of focused card, None index for empty stack.
+    # Focus flags of cards and stacks are set here only, they are used for drawing.
+    def __init__(self):
+        self.stack = None
+        self.index = None
+        self.focused = None  # card or empty stack with focus flag set
+
+    def moveTo(self, stack, index):
+        if self.focused is not None:
+            self.focused.is_focus = False
+
+        self.stack = stack
+        self.index = index
+        self.focused = None
+        if stack is None:
+            return
+        self.focused = stack.cards[index] if index is not None else stack
+        self.focused.is_focus = True
+
+    def clear(self):
+        self.moveTo(None, None)
+
 
 class CardStack:
     def __init__(self):
@@ -74,20 +201,67 @@ class CardStack:
         self.is_focus = False
 
         self.id = 0
-
-    def draw(self):
-        if len(self.cards):
-            for card in self.cards:
-                card.draw()
-        else:
+        # shared by all stacks of the game
+        self.cursor = Cursor()
+
+        # batched render: blits of image bank 0, rebuilt when render key changes
+        self.blits = []
+        self.blits_key = None
+
+    def draw(self, render_key=None):
+        if render_key is None:
+            render_key = self.getRenderKey()
+        if render_key != self.blits_key:
+            self.blits = self.buildBlits()
+            self.blits_key = render_key
+        for x, y, u, v, w, h in self.blits:
+            pyxel.blt(x, y, 0, u, v, w, h, COLKEY)
+
+    def buildBlits(self):
+        # flat (x, y, u, v, w, h) list; cards in flight are left to the game, which draws them on top
+        if not self.cards:
+            blits = [(self.x, self.y, 16, 16 * 4, 16, 16)]
             if self.is_focus is True:
-                pyxel.blt(self.x, self.y, 0, 16 * 2, 16 * 4, 16, 16, COLKEY)
-            pyxel.blt(self.x, self.y, 0, 16, 16 * 4, 16, 16, COLKEY)
+                blits.insert(0, (self.x, self.y, 16 * 2, 16 * 4, 16, 16))
+            return blits
+
+        blits = []
+        cards = self.cards
+        last_index = len(cards) - 1
+        for index, card in enumerate(cards):
+            if card.tween_index >= 0:
+                continue
+            x = card.x + card.offset_x
+            y = card.y + card.offset_y
+            h = card.h
+            next_card = cards[index + 1] if index < last_index else None
+            if next_card is not None and card.isInPlace() and next_card.isInPlace():
+                # card above covers all but the strip over it, through its transparent
+                # corners one more row is seen, cards of equal y are not seen at all
+                if next_card.y == card.y:
+                    continue
+                h = min(h, next_card.y - card.y + 1)
+
+            if card.is_faced is True:
+                blits.append((x, y, card.u, card.v, card.w, h))
+                if card.is_selected is True:
+                    blits.append((x, y, 16 * 3, 16 * 4, 16, h))
+            else:
+                blits.append((x, y, 0, 16 * 4, card.w, h))
+            if card.is_focus is True:
+                blits.append((x, y, 16 * 2, 16 * 4, 16, h))
+        return blits
 
     def update(self):
         for card in self.cards:
             card.update()
 
+    def getRenderKey(self):
+        # everything draw depends on, equal keys mean equal pictures
+        # cards in flight are not drawn by stack, resting cards may be left off their place
+        return self.x, self.is_focus, [(card.u, card.v, card.y, card.is_faced, card.is_focus, card.is_selected,
+                                        card.tween_index >= 0 or (card.offset_x, card.offset_y)) for card in self.cards]
+
     def addCard(self, card):
         card.x = self.x
         card.y = self.y
@@ -100,92 +274,61 @@ class CardStack:
 
         self.cards.append(card)
 
+    def addCards(self, cards):
+        start = len(self.cards)
+        self.cards += cards
+        self.layoutCards(start)
+
+    def layoutCards(self, start=0):
+        # card position follows from pile origin and card below it, so cards
+        # from start up are placed in one pass
+        cards = self.cards
+        x = self.x
+        y = self.y
+        prev_card = None
+        if start:
+            prev_card = cards[start - 1]
+            y = prev_card.y
+
+        for index in range(start, len(cards)):
+            card = cards[index]
+            if prev_card is not None:
+                y += self.y_faced_offset if card.is_faced and prev_card.is_faced else self.y_not_faced_offset
+            card.x = x
+            card.y = y
+            prev_card = card
+
     def popCard(self):
         return self.cards.pop()
 
     def isSelected(self):
-        if self.cards:
-            for card in self.cards:
-                if card.is_focus:
-                    return True
-            return False
-        else:
-            return self.is_focus
+        return self.cursor.stack is self
 
     def unselect(self):
-        if self.cards:
-            for card in self.cards:
-                if card.is_focus:
-                    card.is_focus = False
-                    break
-        else:
-            self.is_focus = False
+        if self.cursor.stack is self:
+            self.cursor.clear()
 
     def select(self):
-        if self.cards:
-            self.cards[-1].is_focus = True
-        else:
-            self.is_focus = True
-
-    def getSelectedCard(self):
-        if not self.cards:
-            return None
-        for card in self.cards:
-            if card.is_focus:
-                return card
+        self.selectTopCard()
 
-    def getNextCard(self, card):
-        if not self.cards:
-            return None
-        if card not in self.cards:
-            return None
-        index = self.cards.index(card)
-        return self.cards[index + 1 - len(self.cards)]
+    def selectIndex(self, index):
+        self.cursor.moveTo(self, index if self.cards else None)
 
-    def getPrevCard(self, card):
-        if not self.cards:
-            return None
-        if card not in self.cards:
+    def getSelectedCard(self):
+        if self.cursor.stack is not self or self.cursor.index is None:
             return None
-        index = self.cards.index(card)
-        return self.cards[index - 1]
-
-    def isTopCard(self, card):
-        if not self.cards:
-            return False
-
-        return self.cards[-1] is card
-
-    def isBottomCard(self, card):
-        if not self.cards:
-            return False
-
-        return self.cards[0] is card
-
-    def isBottomFacedCard(self, card):
-        if not self.cards:
-            return False
-
-        for it_card in self.cards:
-            if it_card.is_faced is True:
-                return it_card is card
-
-        return False
+        return self.cards[self.cursor.index]
 
     def hasCards(self):
         return bool(self.cards)
 
     def moveCardsFromStack(self, stack):
-        self.unselect()
-        stack.selectBottomCard()
+        # cursor goes to first moved card
+        first_index = len(self.cards)
+        self.addCards(stack.cards)
+        stack.cards = []
 
-        temp_cards = []
-        while stack.hasCards():
-            card = stack.popCard()
-            temp_cards.append(card)
-
-        while temp_cards:
-            self.addCard(temp_cards.pop())
+        self.selectIndex(min(first_index, len(self.cards) - 1))
 
     def popFromSelectedToStack(self, stack):
         selected_card = self.getSelectedCard()
@@ -196,40 +339,17 @@ class CardStack:
         if not selected_card.is_faced:
             return
 
-        temp_cards = []
-
-        card = self.popCard()
-        temp_cards.append(card)
-        while card is not selected_card:
-            card = self.popCard()
-            temp_cards.append(card)
-
-        while temp_cards:
-            stack.addCard(temp_cards.pop())
+        index = self.cursor.index
+        stack.addCards(self.cards[index:])
+        del self.cards[index:]
 
-        stack.unselect()
         self.selectTopCard()
 
     def selectTopCard(self):
-        if self.cards:
-            self.cards[-1].is_focus = True
-        else:
-            self.is_focus = True
+        self.cursor.moveTo(self, len(self.cards) - 1 if self.cards else None)
 
     def selectBottomCard(self):
-        if self.cards:
-            self.cards[0].is_focus = True
-        else:
-            self.is_focus = True
-
-    def selectBottomFacedCard(self):
-        if self.cards:
-            for card in self.cards:
-                if card.is_faced is True:
-                    card.is_focus = True
-                    break
-        else:
-            self.is_focus = True
+        self.selectIndex(0)
 
     def hasFacedCards(self):
         if not self.hasCards():
@@ -249,6 +369,25 @@ class CardStack:
         else:
             return CARD_H
 
+    def getCardIndexAt(self, y, faced_index):
+        # index of card seen at screen y, None for empty stack, -1 when y misses the stack.
+        # Layout has two runs of equal offsets: face down cards y_not_faced_offset apart,
+        # then face up cards y_faced_offset apart, so no card is visited
+        offset = y - self.y
+        if offset < 0 or offset >= self.calcHeight():
+            return -1
+        cards = self.cards
+        if not cards:
+            return None
+        top_index = len(cards) - 1
+        faced_index = min(faced_index, top_index)
+        faced_y = faced_index * self.y_not_faced_offset
+        if offset < faced_y:
+            return offset // self.y_not_faced_offset
+        if not self.y_faced_offset:
+            return top_index
+        return min(faced_index + (offset - faced_y) // self.y_faced_offset, top_index)
+
 
 class CardDeck(CardStack):
     def __init__(self):
@@ -270,33 +409,58 @@ class HandStack(CardStack):
 
         self.y_select_offset = 5
 
-    def draw(self):
-        if len(self.cards):
-            for card in self.cards:
-                card.draw()
+    def buildBlits(self):
+        # empty hand is not drawn
+        if not self.cards:
+            return []
+        return super().buildBlits()
 
     def addCard(self, card):
-        super().addCard(card)
-        if len(self.cards) <= 3:
-            return
-
-        a = self.cards[2:]
-        b = self.cards[1:]
-        for cur_card, prev_card in zip(a, b):
-            cur_card.y = prev_card.y + self.y_middle_offset
+        self.cards.append(card)
+        self.layoutCards()
+
+    def layoutCards(self, start=0):
+        # hand depends on its length, with more than 3 cards the middle ones are squeezed,
+        # so it is always laid out as a whole
+        cards = self.cards
+        is_squeezed = len(cards) > 3
+        x = self.x
+        y = self.y
+        prev_card = None
+        for index, card in enumerate(cards):
+            if prev_card is not None:
+                if is_squeezed and index >= 2:
+                    y += self.y_middle_offset
+                elif card.is_faced and prev_card.is_faced:
+                    y += self.y_faced_offset
+                else:
+                    y += self.y_not_faced_offset
+            card.x = x
+            card.y = y
+            prev_card = card
 
     def updatePositionBehindStack(self, card_stack):
         self.x = card_stack.x
         self.y = card_stack.y + card_stack.calcHeight() + self.y_select_offset
+        self.layoutCards()
+
+
+class AutoPlayer(Node):
+    # plays automatic moves one by one, registered for updates only while playing
+    def __init__(self, game, frames_per_move=AUTO_MOVE_FRAMES):
+        super().__init__()
+        self.game = game
+        self.frames_per_move = frames_per_move
+        self.frames_left = frames_per_move
 
-        temp_cards = []
-        while self.cards:
-            card = self.popCard()
-            temp_cards.append(card)
+    def onUpdate(self):
+        self.frames_left -= 1
+        if self.frames_left > 0:
+            return
+        self.frames_left = self.frames_per_move
 
-        while temp_cards:
-            card = temp_cards.pop()
-            self.addCard(card)
+        if not self.game.playAutoMove():
+            self.game.stopAutoComplete()
 
 
 class Game:
@@ -309,11 +473,107 @@ class Game:
 
         self.hand_stack = None
 
+        self.rules = STANDARD_RULES
+        self.engine = Klondike()
+
         self.up_transitions = [[7, 1], [8, 2], [9, 2], [10, 3], [11, 4], [12, 5], [13, 6]]
         self.down_transitions = [[1, 7], [2, 8], [3, 10], [4, 11], [5, 12], [6, 13]]
 
+        # navigation graph, rebuilt with card stacks
+        self.cursor = Cursor()
+        self.all_card_stacks = []
+        self.all_stacks = []
+        self.stack_by_id = {}
+        self.right_stacks = {}
+        self.left_stacks = {}
+        self.up_stacks = {}
+        self.down_stacks = {}
+        self.top_stacks = []  # top row stack of every column, None over the gap
+
+        # mouse: last position for hover, press point and grab offset of dragged cards
+        self.mouse_x = -1
+        self.mouse_y = -1
+        self.drag_start = None
+        self.drag_offset = (0, 0)
+        self.is_dragging = False
+
         self.is_game_over = False
         self.is_instructions_active = False
+        self.winnable_deals_only = True
+        self.seed = None
+        self.records = None
+        self.records_path = RECORDS_PATH
+
+        self.stats = None
+        self.stats_path = STATS_PATH
+        self.game_start_time = 0.0
+        self.is_stats_recorded = False
+        self.is_stats_active = False
+        self.stats_text = ""
+        # resumed games have no deal cards and history of moves before the save, stats still count them
+        self.is_resumed = False
+        self.resumed_moves = 0
+
+        self.save_writer = None
+        self.save_path = SAVE_PATH
+
+        self.deal_pool = None
+        self.deal_pool_path = DEAL_POOL_PATH
+        self.min_difficulty = 0
+        self.max_difficulty = None
+
+        self.is_retained_render = True
+        self.is_background_baked = False
+        self.is_render_dirty = True
+        self.is_full_redraw = True
+        self.column_keys = [None] * COLUMNS_COUNT
+        self.text_cache = TextCache()
+
+        self.auto_complete_mode = AUTO_COMPLETE_ANIMATED
+        self.auto_player = None
+
+        self.hinter = Hinter()
+        self.hint_cards = []
+
+        self.profiler = None
+        self.profile_csv_path = None
+        self.is_profiler_overlay_visible = False
+
+        # keys and clicks wait here while cards fly, none are dropped,
+        # animations are short so the queue never grows beyond a few events
+        self.events = deque()
+        self.dispatched_events = 0
+        self.frame = 0
+        self.input_recorder = None
+        self.input_player = None  # replaces polling of keys and mouse when set
+        self.tweens = TweenPool()
+        self.is_animated = True
+        self.is_win_animated = False
+        self.update_nodes = []
+        self.key_handlers = [
+            (pyxel.KEY_Q, self.onQuit),
+            (pyxel.KEY_ESCAPE, self.onEscape),
+            (pyxel.KEY_RIGHT, self.onMoveRight),
+            (pyxel.KEY_LEFT, self.onMoveLeft),
+            (pyxel.KEY_UP, self.onMoveUp),
+            (pyxel.KEY_DOWN, self.onMoveDown),
+            (pyxel.KEY_ENTER, self.onEnter),
+            (pyxel.KEY_SPACE, self.onSpace),
+            (pyxel.KEY_U, self.onUndo),
+            (pyxel.KEY_R, self.onRedo),
+            (pyxel.KEY_A, self.onAutoComplete),
+            (pyxel.KEY_H, self.onHint),
+            (pyxel.KEY_N, self.onNewGame),  # N - new game
+            (pyxel.KEY_I, self.onToggleInstructions),
+            (pyxel.KEY_S, self.onToggleStats),
+            (pyxel.KEY_G, self.onGameOverCheat),  # G - game over debug cheat
+            (pyxel.KEY_P, self.toggleProfiler),  # P - profiler overlay
+        ]
+        self.key_handler_by_key = dict(self.key_handlers)
+        self.mouse_handler_by_event = {
+            MOUSE_PRESS: self.onMousePress,
+            MOUSE_RELEASE: self.onMouseRelease,
+        }
 
     def run(self):
         pyxel.run(self.update, self.draw)
@@ -321,13 +581,146 @@ class Game:
     def initialize(self):
         pyxel.init(WINDOW_W, WINDOW_H, caption="Pyxel Klondike", quit_key=pyxel.KEY_NONE)
         pyxel.load("assets/game.pyxres")
-        pyxel.mouse(False)
+        pyxel.mouse(True)
 
-        self.reset()
+        self.openDealPool()
+        self.openStats()
+        self.openRecords()
+        self.openSaveWriter()
+        if not self.resumeGame():
+            self.reset()
+
+    def openDealPool(self):
+        # without pool deals are checked by solver on the fly
+        if self.deal_pool_path is None or not os.path.exists(self.deal_pool_path):
+            return
+        try:
+            self.deal_pool = DealPool(self.deal_pool_path)
+        except (OSError, PoolError):
+            self.deal_pool = None
+
+    def openRecords(self):
+        # records are written by a background thread, errors there only stop recording
+        if self.records_path is not None:
+            self.records = RecordStore(self.records_path)
+
+    def openStats(self):
+        # game runs without stats when the store can not be opened
+        if self.stats_path is None:
+            return
+        try:
+            self.stats = StatsStore(self.stats_path)
+        except (OSError, StatsError):
+            self.stats = None
+
+    def openSaveWriter(self):
+        # game is not saved when save path is None
+        if self.save_path is not None:
+            self.save_writer = SaveWriter(self.save_path)
+
+    def resumeGame(self):
+        # restores game saved with the same rules, returns False when there is none
+        if self.save_path is None:
+            return False
+        saved = loadSave(self.save_path)
+        if saved is None or saved.rules.pack() != self.rules.pack():
+            return False
+
+        self.createCardStacks()
+        self.engine.setRules(self.rules)
+        self.engine.setPiles(saved.state.toPiles(), saved.redeals)
+        self.seed = saved.seed
+        self.is_resumed = True
+        self.resumed_moves = saved.moves
+        self.syncCardStacks(saved.state)
+
+        all_stacks = self.getAllCardStacks()
+        if saved.hand is not None:
+            pile, count = saved.hand
+            from_stack = all_stacks[pile]
+            self.hand_stack.addCards(from_stack.cards[-count:])
+            del from_stack.cards[-count:]
+            self.hand_stack.from_stack = from_stack
+        if saved.cursor is not None:
+            pile, index = saved.cursor
+            card_stack = all_stacks[pile]
+            if index is not None and index < len(card_stack.cards):
+                card_stack.selectIndex(index)
+            else:
+                card_stack.selectTopCard()
+        else:
+            self.card_stacks[0].select()
+        self.updateHandStackPosition()
+
+        self.game_start_time = time.monotonic() - saved.elapsed / 1000
+        self.is_stats_recorded = False
+        self.is_game_over = self.isGameOver()
+        self.invalidate(True)
+        return True
+
+    def autosave(self, is_forced=False):
+        # a few bytes packed per event, the writer thread replaces the file when the game changed
+        if self.save_writer is None:
+            return
+        if self.engine.isWon():
+            self.save_writer.remove()
+            return
+        self.save_writer.save(packSave(self.getSavedGame()), is_forced)
+
+    def getSavedGame(self):
+        cursor = None
+        if self.cursor.stack is not None and self.cursor.stack is not self.hand_stack:
+            cursor = self.getCursorPosition()
+        hand = None
+        if self.hand_stack.from_stack is not None and self.hand_stack.hasCards():
+            hand = (self.getPileIndex(self.hand_stack.from_stack), len(self.hand_stack.cards))
+        elapsed = int((time.monotonic() - self.game_start_time) * 1000)
+        return SavedGame(self.rules, self.seed, elapsed, self.getMovesCount(), self.engine.redeals, cursor, hand,
+                         CompactState.fromPiles(self.engine.piles))
+
+    def reset(self, seed=None):
+        self.stopAutoComplete()
+        self.recordStats()
+        self.archiveGame()
+        self.invalidate(True)
+        self.cursor.clear()
+        self.is_win_animated = False
+        self.drag_start = None
+        self.is_dragging = False
 
-    def reset(self):
-        # clear all
         self.is_game_over = False
+        self.is_resumed = False
+        self.resumed_moves = 0
+        self.createCardStacks()
+
+        # rules are resolved by engine once per game
+        self.engine.setRules(self.rules)
+
+        # deal cards, pool gives pre-solved standard rules deals,
+        # otherwise solver filters out deals it can not win in time
+        if seed is None and self.input_player is not None:
+            # played back sessions deal the logged seeds
+            seed = self.input_player.nextDealSeed()
+        entry = None
+        if seed is None and self.winnable_deals_only and self.deal_pool is not None and self.rules.isStandard():
+            entry = self.deal_pool.getRandomEntry(self.min_difficulty, self.max_difficulty)
+        if seed is not None:
+            self.dealSeed(seed)
+        elif entry is not None:
+            self.dealSeed(entry.seed)
+        else:
+            self.dealRandomSeed()
+        self.syncCardStacks(CompactState.fromPiles(self.engine.piles))
+        self.game_start_time = time.monotonic()
+        self.is_stats_recorded = False
+        if self.input_recorder is not None:
+            self.input_recorder.writeDeal(self.frame, self.seed)
+
+        self.card_stacks[0].select()
+        self.animateDeal()
+
+    def createCardStacks(self):
+        # clear all
         self.left_deck = None
         self.right_deck = None
         self.final_decks = []
@@ -352,36 +745,88 @@ class Game:
         self.card_stacks.append(setupCardStack(CardStack(), 1, 6, 13))
 
         self.hand_stack = setupCardStack(HandStack(), 5, 0, 14)
+        self.buildNavigation()
+
+    def buildNavigation(self):
+        # card stack ids:
+        #   [1 ][2 ]____[3 ][4 ][5 ][6 ]
+        #   [7 ][8 ][9 ][10][11][12][13]
+        # left/right go through all stacks in a ring, up/down follow transitions,
+        # so every cursor move is one dict lookup
+        self.all_card_stacks = [self.left_deck, self.right_deck] + self.final_decks + self.card_stacks
+        self.all_stacks = [self.left_deck, self.right_deck] + self.card_stacks + self.final_decks + [self.hand_stack]
+        self.stack_by_id = {card_stack.id: card_stack for card_stack in self.all_stacks}
+
+        ring = self.all_card_stacks
+        self.right_stacks = {card_stack.id: ring[(i + 1) % len(ring)] for i, card_stack in enumerate(ring)}
+        self.left_stacks = {card_stack.id: ring[i - 1] for i, card_stack in enumerate(ring)}
+        self.up_stacks = {from_id: self.stack_by_id[to_id] for from_id, to_id in self.up_transitions}
+        self.down_stacks = {from_id: self.stack_by_id[to_id] for from_id, to_id in self.down_transitions}
+        self.top_stacks = [self.left_deck, self.right_deck, None] + self.final_decks
+
+        for card_stack in self.all_stacks:
+            card_stack.cursor = self.cursor
+
+    def dealRandomSeed(self):
+        # solver filters out deals it can not win in time, all attempts together take at most DEAL_SEARCH_TIME
+        deadline = time.perf_counter() + DEAL_SEARCH_TIME
+        for _ in range(MAX_DEAL_ATTEMPTS):
+            self.dealSeed(random.randrange(MAX_SEED))
+            if not self.winnable_deals_only:
+                return
+            max_time = min(DEFAULT_MAX_TIME, deadline - time.perf_counter())
+            if max_time <= 0:
+                break
+            if solve(self.engine.piles, max_time=max_time, rules=self.rules).isSolved():
+                return
+        # last deal is kept, it may not be winnable
+        sys.stderr.write("no deal was solved in time, seed {} may not be winnable\n".format(self.seed))
+
+    def dealSeed(self, seed):
+        self.seed = seed
+        self.engine.deal(shuffledDeck(seed))
+
+    def archiveGame(self):
+        if self.records is None:
+            return
+        if self.engine.deal_cards is None or not self.engine.history:
+            return
+
+        self.records.add(recordGame(self.engine))
 
-        # init cards
+    def recordStats(self):
+        # once per deal: when it is won, or when it is left after any move
+        if self.stats is None or self.is_stats_recorded:
+            return
+        if (self.engine.deal_cards is None and not self.is_resumed) or not self.getMovesCount():
+            return
 
-        # Suits (total 4):
-        # 0 - clubs, 1 - diamonds, 2 - hearts, 3 - spades
-        # Ranks (total 13):
-        # 0 - Ace, 1 - 2, 2 - 3, 3 - 4, 4 - 5, 5 - 6, 6 - 7, 7 - 8, 8 - 9, 9 - 10, 10 - Jack, 11 - Queen, 12 - King
-        # total cards in deck 52
+        self.is_stats_recorded = True
+        duration = int((time.monotonic() - self.game_start_time) * 1000)
+        self.stats.add(GameStats(time.time(), self.seed, duration, self.getMovesCount(),
+                                 self.rules, self.engine.isWon()))
 
-        cards = []
-        for suit in range(4):
-            for rank in range(13):
-                cards.append(self.createCard(rank, suit, False))
+    def getMovesCount(self):
+        return self.resumed_moves + self.engine.getMovesCount()
 
-        random.shuffle(cards)
+    def syncCardStacks(self, state):
+        # map compact state onto card sprites, card stacks order matches pile indexes
+        all_stacks = self.getAllCardStacks()
+        self.cursor.clear()
+        self.tweens.clear()
+        for card_stack in all_stacks:
+            card_stack.cards = []
 
-        # place cards to stacks
-        for card in cards:
-            self.left_deck.addCard(card)
+        for pile, index, card in state.iterCards():
+            all_stacks[pile].addCard(self.createCard(cardRank(card), cardSuit(card), isFaced(card)))
 
-        counter = 1
-        for card_stack in self.card_stacks:
-            for i in range(counter):
-                card = self.left_deck.popCard()
-                if i == counter - 1:
-                    card.is_faced = True
-                card_stack.addCard(card)
-            counter += 1
+    def refreshCardStacks(self):
+        selected_stack = self.getSelectedStack()
+        selected_id = selected_stack.id if selected_stack is not None else self.left_deck.id
 
-        self.card_stacks[0].cards[-1].is_focus = True
+        self.syncCardStacks(CompactState.fromPiles(self.engine.piles))
+        self.selectCardStackById(selected_id)
+        self.is_game_over = self.isGameOver()
 
     def createCard(self, rank, suit, is_faced=True):
         card = Card(rank, suit)
@@ -396,279 +841,406 @@ class Game:
         return card
 
     def finalize(self):
-        pass
+        if self.profiler is not None:
+            self.profiler.close()
+        if self.deal_pool is not None:
+            self.deal_pool.close()
+        if self.stats is not None:
+            self.stats.close()
+        if self.records is not None:
+            self.records.close()
+        if self.input_recorder is not None:
+            self.input_recorder.close()
+        if self.save_writer is not None:
+            self.save_writer.close()
+
+    def startRecording(self, path):
+        # logged sessions start with a logged deal, not a saved game
+        self.save_path = None
+        self.input_recorder = InputRecorder(path, self.rules)
+
+    def startPlayback(self, path):
+        # rules of logged session, quit key only ends playback
+        self.input_player = InputPlayer.load(path, stop_key=pyxel.KEY_Q)
+        self.save_path = None
+        self.rules = self.input_player.rules
+
+    def runHeadless(self):
+        # plays input log without window and frame cap, the frame loop stays the same apart from drawing;
+        # returns seconds taken
+        player = self.input_player
+        self.openDealPool()
+        self.reset()
+        start = time.perf_counter()
+        while not player.isDone() or self.events or self.tweens.count:
+            self.update()
+        return time.perf_counter() - start
 
     def update(self):
-        if pyxel.btnp(pyxel.KEY_Q):
-            pyxel.quit()
-        elif pyxel.btnp(pyxel.KEY_ESCAPE):
-            self.onEscape()
-        elif pyxel.btnp(pyxel.KEY_RIGHT):
-            self.onMoveRight()
-        elif pyxel.btnp(pyxel.KEY_LEFT):
-            self.onMoveLeft()
-        elif pyxel.btnp(pyxel.KEY_UP):
-            self.onMoveUp()
-        elif pyxel.btnp(pyxel.KEY_DOWN):
-            self.onMoveDown()
-        elif pyxel.btnp(pyxel.KEY_ENTER):
-            self.onEnter()
-        elif pyxel.btnp(pyxel.KEY_SPACE):
-            self.onSpace()
-        elif pyxel.btnp(pyxel.KEY_N):  # N - new game
-            self.reset()
-        elif pyxel.btnp(pyxel.KEY_I):
-            self.is_instructions_active = not self.is_instructions_active
-        elif pyxel.btnp(pyxel.KEY_G):  # G - game over debug cheat
-            self.is_game_over = True
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin(UPDATE)
 
-        for card_stack in self.getAllStacks():
-            card_stack.update()
+        if self.input_player is not None:
+            self.input_player.feed(self, self.frame)
+        else:
+            self.pollInput()
+            self.pollMouse()
+        self.tick()
+        self.frame += 1
+
+        if profiler is not None:
+            profiler.end(UPDATE)
+
+    def pollInput(self):
+        # like before, only first pressed key of the table is taken each frame
+        for key, handler in self.key_handlers:
+            if pyxel.btnp(key):
+                self.postEvent(key)
+                break
+
+    def pollMouse(self):
+        # clicks are queued like keys, hover and drag follow the mouse every frame
+        x = pyxel.mouse_x
+        y = pyxel.mouse_y
+        if pyxel.btnp(pyxel.MOUSE_LEFT_BUTTON):
+            self.postEvent((MOUSE_PRESS, x, y))
+        if pyxel.btnr(pyxel.MOUSE_LEFT_BUTTON):
+            self.postEvent((MOUSE_RELEASE, x, y))
+        if x != self.mouse_x or y != self.mouse_y:
+            self.moveMouse(x, y)
+
+    def moveMouse(self, x, y):
+        if self.input_recorder is not None:
+            self.input_recorder.writeMouse(self.frame, MOUSE_MOVE_CODE, x, y)
+        self.mouse_x = x
+        self.mouse_y = y
+        self.onMouseMove(x, y)
+
+    def postEvent(self, key):
+        # synthetic events (tests, replays) go through the same queue as real keys
+        if self.input_recorder is not None:
+            if isinstance(key, tuple):
+                self.input_recorder.writeMouse(self.frame, *key)
+            else:
+                self.input_recorder.writeKey(self.frame, key)
+        self.events.append(key)
+
+    def dispatchEvent(self, key):
+        self.dispatched_events += 1
+        if isinstance(key, tuple):
+            event, x, y = key
+            handler = self.mouse_handler_by_event.get(event)
+            args = (x, y)
+        else:
+            handler = self.key_handler_by_key.get(key)
+            args = ()
+        if handler is None:
+            return
+        # any key skips auto complete animation and hides hint
+        if self.auto_player is not None:
+            self.finishAutoComplete()
+        self.clearHint()
+        handler(*args)
+        self.invalidate()
+        self.autosave()
+
+    def tick(self):
+        events = self.events
+        while events and not self.isInputBlocked():
+            self.dispatchEvent(events.popleft())
+
+        if self.is_game_over and not self.is_win_animated:
+            if self.engine.isWon():
+                self.recordStats()
+                self.autosave()  # removes the save
+            self.animateWin()
+
+        if not self.update_nodes and not self.tweens.count:
+            return
+
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin(NODES_UPDATE)
+        if self.tweens.count:
+            self.tweens.update()
+            # flying cards cross columns, last frame puts them in place
+            self.invalidate(True)
+        for node in self.update_nodes:
+            node.update()
+        if profiler is not None:
+            profiler.end(NODES_UPDATE)
+
+    def isInputBlocked(self):
+        # keys wait in queue while cards fly, except for auto play and win animation which any key skips
+        return self.tweens.count > 0 and self.auto_player is None and not self.is_game_over
+
+    def registerUpdate(self, node):
+        # only registered nodes are ticked every frame
+        if node not in self.update_nodes:
+            self.update_nodes.append(node)
+
+    def unregisterUpdate(self, node):
+        if node in self.update_nodes:
+            self.update_nodes.remove(node)
+
+    def onQuit(self):
+        # saved game is not over, it is recorded when it is finished after resume
+        if self.save_writer is None or self.engine.isWon():
+            self.recordStats()
+            self.archiveGame()
+        # elapsed time is saved with changes only, the last save gets the time played until quit
+        self.autosave(True)
+        if self.profiler is not None:
+            self.profiler.close()
+        if self.stats is not None:
+            self.stats.close()
+        if self.records is not None:
+            self.records.close()
+        if self.input_recorder is not None:
+            self.input_recorder.close()
+        if self.save_writer is not None:
+            self.save_writer.close()
+        pyxel.quit()
+
+    def onNewGame(self):
+        self.reset()
+
+    def onToggleInstructions(self):
+        self.is_instructions_active = not self.is_instructions_active
+        self.invalidate(True)
+
+    def onToggleStats(self):
+        # aggregates are kept up to date by the store, showing them reads no files
+        self.is_stats_active = not self.is_stats_active
+        if self.is_stats_active:
+            self.stats_text = formatSummary(self.stats.summary) if self.stats is not None else "NO STATS"
+        self.invalidate(True)
+
+    def onGameOverCheat(self):
+        self.is_game_over = True
+
+    def toggleProfiler(self):
+        if self.profiler is None:
+            self.profiler = Profiler(csv_path=self.profile_csv_path)
+        self.is_profiler_overlay_visible = not self.is_profiler_overlay_visible
+        self.invalidate(True)
 
     def getAllCardStacks(self):
-        return [self.left_deck, self.right_deck] + self.final_decks + self.card_stacks
+        return self.all_card_stacks
 
     def getAllStacks(self):
-        return [self.left_deck, self.right_deck] + self.card_stacks + self.final_decks + [self.hand_stack]
+        return self.all_stacks
 
-    def getUpTransitionToId(self, card_stack_id):
-        for from_id, to_id in self.up_transitions:
-            if card_stack_id == from_id:
-                return to_id
-        return None
+    def getCursorPosition(self):
+        # (pile, card index) of cursor, index is None on empty pile
+        if self.cursor.stack is None:
+            return None
+        return self.getPileIndex(self.cursor.stack), self.cursor.index
 
-    def getDownTransitionToId(self, card_stack_id):
-        for from_id, to_id in self.down_transitions:
-            if card_stack_id == from_id:
-                return to_id
-        return None
+    def getFacedIndex(self, card_stack):
+        # index of first face up card of tableau stack, engine keeps it up to date
+        return self.engine.faced_indexes[self.getPileIndex(card_stack)]
 
     def selectCardStackById(self, card_stack_id):
-        for card_stack in self.getAllStacks():
-            if card_stack.id == card_stack_id:
-                card_stack.select()
-                break
+        card_stack = self.stack_by_id.get(card_stack_id)
+        if card_stack is not None:
+            card_stack.select()
 
     def getCardStackById(self, card_stack_id):
-        for card_stack in self.getAllStacks():
-            if card_stack.id == card_stack_id:
-                return card_stack
-        return None
+        return self.stack_by_id.get(card_stack_id)
 
     def tryMakeUpSelectTransition(self, card_stack):
-        to_id = self.getUpTransitionToId(card_stack.id)
+        to_stack = self.up_stacks.get(card_stack.id)
 
-        if to_id is None:
+        if to_stack is None:
             return False
 
-        card_stack.unselect()
-        self.selectCardStackById(to_id)
+        to_stack.select()
         return True
 
     def tryMakeDownSelectTransition(self, card_stack):
-        to_id = self.getDownTransitionToId(card_stack.id)
+        to_stack = self.down_stacks.get(card_stack.id)
 
-        if to_id is None:
+        if to_stack is None:
             return False
 
-        card_stack.unselect()
-        to_stack = self.getCardStackById(to_id)
         if to_stack.hasFacedCards():
-            to_stack.selectBottomFacedCard()
+            to_stack.selectIndex(self.getFacedIndex(to_stack))
         else:
             to_stack.select()
         return True
 
     def updateHandStackPosition(self):
         if self.hand_stack.hasCards():
-            focused_stack = None
-            for card_stack in self.getAllCardStacks():
-                if card_stack.isSelected():
-                    focused_stack = card_stack
-                    break
+            focused_stack = self.cursor.stack
             if focused_stack is None:
                 return
-            if focused_stack in [self.left_deck, self.right_deck] + self.final_decks:
-                to_stack = None
-                for from_id, to_id in self.down_transitions:
-                    if focused_stack.id == from_id:
-                        to_stack = self.getCardStackById(to_id)
-                        break
-                if to_stack is not None:
-                    self.hand_stack.updatePositionBehindStack(to_stack)
-                else:
-                    self.hand_stack.updatePositionBehindStack(focused_stack)
-            else:
-                self.hand_stack.updatePositionBehindStack(focused_stack)
+            # under top row stacks hand is shown below tableau pile
+            to_stack = self.down_stacks.get(focused_stack.id, focused_stack)
+            self.hand_stack.updatePositionBehindStack(to_stack)
 
     def isGameOver(self):
-        # check left, right and bottom stacks for emptyness
-        for card_stack in [self.left_deck, self.right_deck] + self.card_stacks:
-            if card_stack.hasCards():
-                return False
+        return self.engine.isWon()
+
+    def hitTest(self, x, y):
+        # (stack, card index) at screen point, index is None on empty stack, None when nothing is hit.
+        # Columns are equal x ranges and piles know their y offsets, so it takes the same time
+        # wherever the point is
+        column, column_x = divmod(x - self.card_stacks[0].x, COLUMN_W)
+        if column < 0 or column >= COLUMNS_COUNT or column_x >= CARD_W:
+            return None
 
-        # TO DO
+        card_stack = self.top_stacks[column]
+        if card_stack is not None and card_stack.y <= y < card_stack.y + CARD_H:
+            return card_stack, len(card_stack.cards) - 1 if card_stack.cards else None
 
-        return True
+        card_stack = self.card_stacks[column]
+        index = card_stack.getCardIndexAt(y, self.getFacedIndex(card_stack))
+        if index == -1:
+            return None
+        return card_stack, index
+
+    def selectHit(self, card_stack, index):
+        # face down cards can not be picked, cursor goes to first face up card or top card
+        if index is not None and card_stack in self.card_stacks:
+            index = max(index, min(self.getFacedIndex(card_stack), len(card_stack.cards) - 1))
+        if card_stack is not self.cursor.stack or index != self.cursor.index:
+            card_stack.selectIndex(index)
+            self.invalidate()
+
+    def onMouseMove(self, x, y):
+        # hover moves the cursor, dragged cards follow the mouse
+        if self.is_game_over:
+            return
+
+        if self.drag_start is not None and self.hand_stack.hasCards():
+            start_x, start_y = self.drag_start
+            if not self.is_dragging and max(abs(x - start_x), abs(y - start_y)) >= DRAG_DISTANCE:
+                self.is_dragging = True
+            if self.is_dragging:
+                self.hand_stack.x = x - self.drag_offset[0]
+                self.hand_stack.y = y - self.drag_offset[1]
+                self.hand_stack.layoutCards()
+                # dragged cards cross columns
+                self.invalidate(True)
+
+        hit = self.hitTest(x, y)
+        if hit is None:
+            return
+        card_stack, index = hit
+        if self.hand_stack.hasCards():
+            # drop target gets the cursor, held cards go behind it like with keys
+            if card_stack is not self.cursor.stack:
+                card_stack.select()
+                if not self.is_dragging:
+                    self.updateHandStackPosition()
+                self.invalidate()
+        else:
+            self.selectHit(card_stack, index)
+
+    def onMousePress(self, x, y):
+        if self.is_game_over:
+            return
+
+        hit = self.hitTest(x, y)
+        if self.hand_stack.hasCards():
+            # second click places held cards
+            self.dropHandAt(hit)
+            return
+        if hit is None:
+            return
+
+        card_stack, index = hit
+        self.selectHit(card_stack, index)
+        card = card_stack.getSelectedCard()
+        # grabbed card moves to the hand, its screen position is taken before
+        card_x, card_y = self.getScreenPositions([card])[0] if card is not None else (x, y)
+        self.holdCardsToHandStack()
+        if self.hand_stack.hasCards():
+            # cards are dragged by the point they were grabbed at, first card of hand is at hand position
+            self.drag_start = (x, y)
+            self.drag_offset = (x - card_x, y - card_y)
+
+    def onMouseRelease(self, x, y):
+        # release after click keeps cards held until the next click
+        is_dragging = self.is_dragging
+        self.drag_start = None
+        self.is_dragging = False
+        if is_dragging and self.hand_stack.hasCards():
+            self.dropHandAt(self.hitTest(x, y))
+
+    def dropHandAt(self, hit):
+        # cards go to the hit stack if rules allow, otherwise back where they came from
+        if hit is not None:
+            hit[0].select()
+            self.placeCardsFromHandStack()
+        if self.hand_stack.hasCards():
+            self.onEscape()
+        self.invalidate(True)
 
     def onMoveRight(self):
         # print("right")
-        if self.is_game_over:
+        if self.is_game_over or self.cursor.stack is None:
             return
-        all_stacks = self.getAllCardStacks()
-        shifted_stacks = all_stacks[1:] + [all_stacks[0]]
-        for cur_stack, next_stack in zip(all_stacks, shifted_stacks):
-            if cur_stack.isSelected() is True:
-                cur_stack.unselect()
-                next_stack.select()
-                break
 
+        self.right_stacks[self.cursor.stack.id].select()
         self.updateHandStackPosition()
 
     def onMoveLeft(self):
         # print("left")
-        if self.is_game_over:
+        if self.is_game_over or self.cursor.stack is None:
             return
-        all_stacks = self.getAllCardStacks()
-        shifted_stacks = [all_stacks[-1]] + all_stacks[0:-1]
-        for cur_stack, next_stack in zip(reversed(all_stacks), reversed(shifted_stacks)):
-            if cur_stack.isSelected() is True:
-                cur_stack.unselect()
-                next_stack.select()
-                break
 
+        self.left_stacks[self.cursor.stack.id].select()
         self.updateHandStackPosition()
 
     def onMoveUp(self):
         # print("up")
-
-        if self.is_game_over:
+        if self.is_game_over or self.cursor.stack is None:
             return
 
-        # idea for cursor move to top decks from bottom stacks and vice versa:
-        # 1. add to each card stack unique id:
-        #   [1 ][2 ]____[3 ][4 ][5 ][6 ]
-        #   [7 ][8 ][9 ][10][11][12][13]
-        # 2. define vector of up and down transitions:
-        #   transitions = [
-        #       [7, 1], [8, 2], [9, 2], [10, 3], [11, 4], [12, 5], [13, 6],   # up
-        #       [1, 7], [2, 8], [3, 10], [4, 11], [5, 12], [6, 13]            # down
-        #   ]
-        # 3. when prev_card is None try to do transition according to
-
-        focus_card_stack = None
+        focus_card_stack = self.cursor.stack
+        index = self.cursor.index
 
-        for card_stack in self.card_stacks:
-            if card_stack.isSelected() is True:
-                focus_card_stack = card_stack
-                break
-
-        if focus_card_stack is None:
-            for card_stack in [self.left_deck, self.right_deck] + self.final_decks:
-                if card_stack.isSelected() is True:
-                    focus_card_stack = card_stack
-            if focus_card_stack:
-                self.tryMakeUpSelectTransition(focus_card_stack)
+        # top row has no way up
+        if focus_card_stack.id not in self.up_stacks:
             return
 
-        if not focus_card_stack.hasCards():
+        # from empty pile, face down and first face up card go up to top row
+        if index is None or index <= self.getFacedIndex(focus_card_stack):
             self.tryMakeUpSelectTransition(focus_card_stack)
             return
 
-        selected_card = focus_card_stack.getSelectedCard()
-
-        if (selected_card.is_faced is False or focus_card_stack.isBottomFacedCard(selected_card)) and self.tryMakeUpSelectTransition(focus_card_stack):
-            return
-
-        prev_card = focus_card_stack.getPrevCard(selected_card)
-
-        selected_card.is_focus = False
-
-        if prev_card.is_faced:
-            prev_card.is_focus = True
-        else:
-            focus_card_stack.selectTopCard()
+        focus_card_stack.selectIndex(index - 1)
 
     def onMoveDown(self):
         # print("down")
-
-        if self.is_game_over:
+        if self.is_game_over or self.cursor.stack is None:
             return
 
-        focus_card_stack = None
-
-        for card_stack in self.card_stacks:
-            if card_stack.isSelected() is True:
-                focus_card_stack = card_stack
-                break
-
-        if focus_card_stack is None:
-            for card_stack in [self.left_deck, self.right_deck] + self.final_decks:
-                if card_stack.isSelected() is True:
-                    focus_card_stack = card_stack
-            if focus_card_stack:
-                self.tryMakeDownSelectTransition(focus_card_stack)
-            return
+        focus_card_stack = self.cursor.stack
+        index = self.cursor.index
 
-        if not focus_card_stack.hasCards():
+        if self.tryMakeDownSelectTransition(focus_card_stack):
             return
 
-        selected_card = focus_card_stack.getSelectedCard()
-
-        if (selected_card.is_faced is False or focus_card_stack.isTopCard(selected_card)) and self.tryMakeDownSelectTransition(focus_card_stack):
+        if index is None:
             return
 
-        next_card = focus_card_stack.getNextCard(selected_card)
-
-        selected_card.is_focus = False
-
-        if next_card.is_faced:
-            next_card.is_focus = True
+        # from top card go around to first face up card
+        if index == len(focus_card_stack.cards) - 1:
+            faced_index = self.getFacedIndex(focus_card_stack)
+            focus_card_stack.selectIndex(faced_index if faced_index < len(focus_card_stack.cards) else index)
         else:
-            if focus_card_stack.hasFacedCards():
-                focus_card_stack.selectBottomFacedCard()
-            else:
-                focus_card_stack.select()
+            focus_card_stack.selectIndex(index + 1)
 
     def getSelectedStack(self):
-        all_stacks = self.getAllCardStacks()
+        return self.cursor.stack
 
-        for card_stack in all_stacks:
-            if card_stack.isSelected():
-                return card_stack
-
-        return None
-
-    def checkPlaceFromHandToNotEmptyStack(self, stack):
-        hand_stack_card = self.hand_stack.cards[0]
-        card_stack_card = stack.cards[-1]
-
-        if stack in self.card_stacks:
-            if hand_stack_card.rank != card_stack_card.rank - 1:
-                return False
-
-            if (hand_stack_card.suit == 0 or hand_stack_card.suit == 3) and\
-                    (card_stack_card.suit == 1 or card_stack_card.suit == 2):
-                return True
-            elif (hand_stack_card.suit == 1 or hand_stack_card.suit == 2) and\
-                    (card_stack_card.suit == 0 or card_stack_card.suit == 3):
-                return True
-        elif stack in self.final_decks:
-            if hand_stack_card.rank != card_stack_card.rank + 1:
-                return False
-
-            if hand_stack_card.suit == card_stack_card.suit:
-                return True
-        return False
-
-    def checkPlaceFromHandToEmptyStack(self, stack):
-        if stack in self.card_stacks:
-            if self.hand_stack.cards[0].rank == 12:  # King
-                return True
-        elif stack in self.final_decks:
-            if self.hand_stack.cards[0].rank == 0:  # Ace
-                return True
-        return False
+    def getPileIndex(self, card_stack):
+        # engine piles are indexed the same way as card stack ids
+        return card_stack.id - 1
 
     def holdCardsToHandStack(self):
         selected_card_stack = self.getSelectedStack()
@@ -677,26 +1249,79 @@ class Game:
             return
 
         if selected_card_stack is self.left_deck:
-            if self.left_deck.hasCards():
-                card = self.left_deck.popCard()
-                card.is_faced = True
-                self.right_deck.addCard(card)
-            else:
-                while self.right_deck.hasCards():
-                    card = self.right_deck.popCard()
-                    card.is_faced = False
-                    self.left_deck.addCard(card)
+            # draw or turn waste over, as rules allow
+            move = self.engine.getStockMove()
+            if move is not None and self.engine.makeMove(move):
+                self.applyMoveToCardStacks(move)
             self.right_deck.unselect()
             self.left_deck.selectTopCard()
         else:
+            pile = self.getPileIndex(selected_card_stack)
             if selected_card_stack.hasCards() and not selected_card_stack.hasFacedCards():
-                selected_card_stack.openCard()
+                if self.engine.makeMove((pile, pile, 0)):
+                    selected_card_stack.openCard()
+                    self.checkAutoComplete()
             else:
+                positions = self.getScreenPositions(selected_card_stack.cards)
                 selected_card_stack.popFromSelectedToStack(self.hand_stack)
-                self.hand_stack.from_stack = selected_card_stack
+                if self.hand_stack.hasCards():
+                    self.hand_stack.from_stack = selected_card_stack
+                    self.updateHandStackPosition()
+                    # picked up cards were the top ones of the stack
+                    hand_cards = self.hand_stack.cards
+                    self.animateCards(hand_cards, positions[len(positions) - len(hand_cards):])
+                    return
 
         self.updateHandStackPosition()
 
+    def dropHandToStack(self, card_stack):
+        cards = self.hand_stack.cards
+        positions = self.getScreenPositions(cards)
+        card_stack.moveCardsFromStack(self.hand_stack)
+        self.animateCards(cards, positions)
+
+    def getScreenPositions(self, cards):
+        return [(card.x + card.offset_x, card.y + card.offset_y) for card in cards]
+
+    def animateCards(self, cards, positions, frames=MOVE_FRAMES):
+        # cards fly from old screen positions to their new layout positions
+        if not self.is_animated:
+            return
+        for card, (x, y) in zip(cards, positions):
+            self.tweens.add(card, x - card.x, y - card.y, 0, 0, frames)
+
+    def animateDeal(self):
+        # tableau cards fly from stock in the order they were dealt
+        if not self.is_animated:
+            return
+        delay = 0
+        for card_stack in self.card_stacks:
+            for card in card_stack.cards:
+                self.tweens.add(card, self.left_deck.x - card.x, self.left_deck.y - card.y, 0, 0, DEAL_FRAMES, delay)
+                delay += DEAL_DELAY_FRAMES
+
+    def animateWin(self):
+        # foundation cards leave one by one from the top and spill over the bottom of the screen
+        self.is_win_animated = True
+        if not self.is_animated:
+            return
+        order = 0
+        for level in reversed(range(RANKS_COUNT)):
+            for card_stack in self.final_decks:
+                if level >= len(card_stack.cards):
+                    continue
+                card = card_stack.cards[level]
+                x = (order * 37) % (WINDOW_W - CARD_W)
+                y = WINDOW_H - CARD_H - (order % 5) * 3
+                self.tweens.add(card, 0, 0, x - card.x, y - card.y, WIN_FRAMES, order * WIN_DELAY_FRAMES)
+                order += 1
+
+    def drawFlyingCards(self):
+        # cards in flight are drawn again over all stacks
+        tweens = self.tweens
+        for index in range(tweens.count):
+            tweens.targets[index].draw()
+
     def placeCardsFromHandStack(self):
         selected_card_stack = self.getSelectedStack()
 
@@ -704,20 +1329,21 @@ class Game:
             return
 
         if selected_card_stack is self.hand_stack.from_stack:
-            selected_card_stack.moveCardsFromStack(self.hand_stack)
+            self.dropHandToStack(selected_card_stack)
             self.hand_stack.from_stack = None
             # BACK CARDS TO FROM STACK
-        elif selected_card_stack not in [self.left_deck, self.right_deck]:
-            if selected_card_stack.hasFacedCards():
-                # DROP ON FACED CARDS
-                if self.checkPlaceFromHandToNotEmptyStack(selected_card_stack):
-                    selected_card_stack.moveCardsFromStack(self.hand_stack)
-                    self.hand_stack.from_stack = None
-            elif not selected_card_stack.hasCards():
-                # DROP ON EMPTY STACK
-                if self.checkPlaceFromHandToEmptyStack(selected_card_stack):
-                    selected_card_stack.moveCardsFromStack(self.hand_stack)
-                    self.hand_stack.from_stack = None
+        elif (self.hand_stack.from_stack is not None and self.hand_stack.hasCards()
+              and selected_card_stack not in [self.left_deck, self.right_deck]):
+            # DROP ON OTHER STACK, rules are checked by engine, stock and waste never take dropped cards
+            move = (
+                self.getPileIndex(self.hand_stack.from_stack),
+                self.getPileIndex(selected_card_stack),
+                len(self.hand_stack.cards)
+            )
+            if self.engine.makeMove(move):
+                self.dropHandToStack(selected_card_stack)
+                self.hand_stack.from_stack = None
+                self.checkAutoComplete()
         if not self.hand_stack.hasCards():
             if self.isGameOver():
                 self.is_game_over = True
@@ -753,70 +1379,163 @@ class Game:
         selected_card_stack = self.getSelectedStack()
         selected_card_stack.unselect()
 
-        self.hand_stack.from_stack.moveCardsFromStack(self.hand_stack)
+        self.dropHandToStack(self.hand_stack.from_stack)
         self.hand_stack.from_stack = None
 
+    def onUndo(self):
+        if self.hand_stack.hasCards():
+            self.onEscape()
+
+        if self.engine.undo() is not None:
+            self.refreshCardStacks()
+
+    def onRedo(self):
+        if self.hand_stack.hasCards():
+            self.onEscape()
+
+        if self.engine.redo() is not None:
+            self.refreshCardStacks()
+
+    def onAutoComplete(self):
+        # plays safe foundation moves, or the whole game once every card is face up
+        self.startAutoComplete()
+
+    def checkAutoComplete(self):
+        # cheap enough to run after every player move
+        if self.auto_complete_mode == AUTO_COMPLETE_OFF:
+            return
+        if self.engine.canAutoComplete() and self.engine.getAutoMove() is not None:
+            self.startAutoComplete()
+
+    def startAutoComplete(self):
+        if self.is_game_over or self.auto_player is not None:
+            return
+        if self.hand_stack.hasCards():
+            self.onEscape()
+
+        if self.auto_complete_mode == AUTO_COMPLETE_INSTANT:
+            self.finishAutoComplete()
+            return
+
+        self.auto_player = AutoPlayer(self)
+        self.registerUpdate(self.auto_player)
+
+    def stopAutoComplete(self):
+        if self.auto_player is not None:
+            self.unregisterUpdate(self.auto_player)
+            self.auto_player = None
+
+    def finishAutoComplete(self):
+        self.stopAutoComplete()
+        if self.engine.autoComplete():
+            self.refreshCardStacks()
+
+    def playAutoMove(self):
+        move = self.engine.getAutoMove()
+        if move is None:
+            return False
+
+        if self.hand_stack.hasCards():
+            self.onEscape()
+        self.engine.applyMove(move)
+        self.applyMoveToCardStacks(move)
+        self.is_game_over = self.isGameOver()
+        self.invalidate()
+        self.autosave()
+        return True
+
+    def applyMoveToCardStacks(self, move):
+        # mirror engine move on card sprites without rebuilding them
+        src, dst, count = move
+        all_stacks = self.getAllCardStacks()
+        src_stack = all_stacks[src]
+        dst_stack = all_stacks[dst]
+
+        if src == dst:
+            src_stack.openCard()
+            return
+
+        selected_stack = self.getSelectedStack()
+        if selected_stack is src_stack or selected_stack is dst_stack:
+            selected_stack.unselect()
+        else:
+            selected_stack = None
+
+        cards = src_stack.cards[-count:]
+        del src_stack.cards[-count:]
+        if dst == STOCK:
+            cards.reverse()
+            for card in cards:
+                card.is_faced = False
+        elif src == STOCK:
+            # drawn one by one, like in engine
+            cards.reverse()
+            for card in cards:
+                card.is_faced = True
+
+        positions = self.getScreenPositions(cards)
+        dst_stack.addCards(cards)
+        self.animateCards(cards, positions)
+
+        if selected_stack is not None:
+            selected_stack.select()
+
+    def onHint(self):
+        # highlights cards of best move, stock and face down cards get the cursor instead
+        if self.is_game_over:
+            return
+        if self.hand_stack.hasCards():
+            self.onEscape()
+
+        move = self.hinter.getHint(self.engine)
+        if move is None:
+            return
+
+        src, dst, count = move
+        all_stacks = self.getAllCardStacks()
+        src_stack = all_stacks[src]
+        if src == dst or src == STOCK:
+            selected_stack = self.getSelectedStack()
+            if selected_stack is not None:
+                selected_stack.unselect()
+            src_stack.select()
+            return
+
+        self.hint_cards = src_stack.cards[-count:]
+        if dst != STOCK and all_stacks[dst].hasCards():
+            self.hint_cards.append(all_stacks[dst].cards[-1])
+        for card in self.hint_cards:
+            card.is_selected = True
+
+    def clearHint(self):
+        for card in self.hint_cards:
+            card.is_selected = False
+        self.hint_cards = []
+
     def drawBackground(self):
         pyxel.cls(11)
 
     def drawCardStacks(self):
+        if self.profiler is not None:
+            self.profiler.begin(CARD_BLITS)
         for card_stack in self.getAllStacks():
             card_stack.draw()
+        self.drawFlyingCards()
+        if self.profiler is not None:
+            self.profiler.end(CARD_BLITS)
 
     def drawInstructions(self):
         x, y = self.calcScreenCenterPosition()
-        msg = """
-           RULES
-           - + -
-
-To win Klondike Solitaire 
-you must move all the cards
-to the four goals. Each
-foundation can only hold
-one suit and you must put
-the cards sequencing from
-Ace to King: Ace, 2, 3, 4,
-5, 6, 7, 8, 9, Jack, Queen
-and King. You have to
-complete all suits to win
-the game: clubs, diamonds,
-hearts and spades. 
-
-   <I> - SHOW CONTROLLS"""
-        half_msg_width = self.calcTextWidth(msg) // 2
-        pyxel.text(x - half_msg_width, y - 24, msg, 3)
+        half_msg_width = self.calcTextWidth(INSTRUCTIONS_MSG) // 2
+        self.text_cache.draw(x - half_msg_width, y - 24, INSTRUCTIONS_MSG, HELP_COL)
 
     def drawCotrollsInfo(self):
         x, y = self.calcScreenCenterPosition()
-        msg = """   KEYBOARD CONTROLLS
-   - - - - + - - - - 
- 
-    ARROWS - MOVE
-   <SPACE> - HOLD/PLACE
-   <ENTER> - HOLD/PLACE
-     <ESC> - DROP
-     
-       <N> - NEW GAME
-       <I> - GAME  (!)
-             RULES
-       <Q> - EXIT"""
-        half_msg_width = self.calcTextWidth(msg) // 2
-        pyxel.text(x - half_msg_width, y, msg, 3)
+        half_msg_width = self.calcTextWidth(CONTROLS_MSG) // 2
+        self.text_cache.draw(x - half_msg_width, y, CONTROLS_MSG, HELP_COL)
 
     def calcTextWidth(self, msg):
-        lens = []
-        cur_len = 0
-        for char in msg:
-            if char == '\n':
-                lens.append(cur_len)
-                cur_len = 0
-            else:
-                cur_len += 1
-        if lens:
-            max_len = max(lens)
-        else:
-            max_len = cur_len
-        return max_len * CHAR_W
+        return self.text_cache.calcTextWidth(msg)
 
     def calcScreenCenterPosition(self):
         x = WINDOW_W // 2
@@ -824,36 +1543,169 @@ hearts and spades.
         return x, y
 
     def drawGaveOver(self):
+        if self.profiler is not None:
+            self.profiler.begin(GAME_OVER)
+        x, y = self.calcScreenCenterPosition()
+        half_msg_width = self.calcTextWidth(GAME_OVER_MSG) // 2
+        # outlined banner is one blt from text cache
+        self.text_cache.draw(x - half_msg_width, y - 7, GAME_OVER_MSG, GAME_OVER_COL, GAME_OVER_OUTLINE_COL)
+        if self.profiler is not None:
+            self.profiler.end(GAME_OVER)
+
+    def getStatsMessage(self):
+        return "S T A T S\n\n" + self.stats_text
+
+    def drawStats(self):
         x, y = self.calcScreenCenterPosition()
-        msg = "G A M E   O V E R"
+        msg = self.getStatsMessage()
         half_msg_width = self.calcTextWidth(msg) // 2
+        lines_count = msg.count("\n") + 1
+        top = y - lines_count * 3
+        pyxel.rect(x - half_msg_width - 4, top - 4, half_msg_width * 2 + 8, lines_count * 6 + 7, 1)
+        self.text_cache.draw(x - half_msg_width, top, msg, STATS_COL)
+
+    def prepareTexts(self):
+        # texts of this frame are rendered to image bank before it is drawn,
+        # True when screen was used for that and has to be redrawn as a whole
+        is_rendered = False
+        if not self.is_retained_render:
+            if self.is_instructions_active:
+                is_rendered |= self.text_cache.prepare(INSTRUCTIONS_MSG, HELP_COL)
+            else:
+                is_rendered |= self.text_cache.prepare(CONTROLS_MSG, HELP_COL)
+        if self.is_game_over:
+            is_rendered |= self.text_cache.prepare(GAME_OVER_MSG, GAME_OVER_COL, GAME_OVER_OUTLINE_COL)
+        if self.is_stats_active:
+            is_rendered |= self.text_cache.prepare(self.getStatsMessage(), STATS_COL)
+        return is_rendered
+
+    def invalidate(self, is_full_redraw=False):
+        self.is_render_dirty = True
+        if is_full_redraw:
+            self.is_full_redraw = True
+
+    def bakeBackgrounds(self):
+        # draw both help screens once and keep them in image bank
+        if self.profiler is not None:
+            self.profiler.begin(TEXT)
+        for u, is_instructions_active in [(0, False), (WINDOW_W, True)]:
+            self.drawBackground()
+            if is_instructions_active:
+                self.drawInstructions()
+            else:
+                self.drawCotrollsInfo()
+            self.copyScreenToImage(BACKGROUND_BANK, u, 0)
+        self.is_background_baked = True
+        if self.profiler is not None:
+            self.profiler.end(TEXT)
+
+    def copyScreenToImage(self, img, u, v):
+        rows = []
+        for y in range(WINDOW_H):
+            rows.append("".join("{:x}".format(pyxel.pget(x, y)) for x in range(WINDOW_W)))
+        pyxel.image(img).set(u, v, rows)
+
+    def getBackgroundU(self):
+        return WINDOW_W if self.is_instructions_active else 0
+
+    def getColumnStacks(self, column):
+        stacks = [self.card_stacks[column]]
+        if column < 2:
+            stacks.insert(0, [self.left_deck, self.right_deck][column])
+        elif column > 2:
+            stacks.insert(0, self.final_decks[column - 3])
+        if self.hand_stack.hasCards() and self.hand_stack.x == self.card_stacks[column].x:
+            stacks.append(self.hand_stack)
+        return stacks
+
+    def calcColumnKeys(self):
+        keys = []
+        for column in range(COLUMNS_COUNT):
+            stacks = self.getColumnStacks(column)
+            keys.append([(card_stack.id, card_stack.getRenderKey()) for card_stack in stacks])
+        return keys
+
+    def drawColumn(self, column, column_keys):
+        x = self.card_stacks[column].x
+        pyxel.blt(x, 0, BACKGROUND_BANK, self.getBackgroundU() + x, 0, CARD_W, WINDOW_H)
+        if self.profiler is not None:
+            self.profiler.begin(CARD_BLITS)
+        # render keys of this frame are known already
+        for card_stack, (card_stack_id, render_key) in zip(self.getColumnStacks(column), column_keys[column]):
+            card_stack.draw(render_key)
+        if self.profiler is not None:
+            self.profiler.end(CARD_BLITS)
 
-        COL_1 = 1
-        COL_2 = 15
+    def draw(self):
+        profiler = self.profiler
+        if profiler is None:
+            self.drawScreen()
+            return
 
-        pyxel.text(x - half_msg_width + 1, y- 7, msg, COL_1)
-        pyxel.text(x - half_msg_width, y + 1- 7, msg, COL_1)
-        pyxel.text(x - half_msg_width - 1, y- 7, msg, COL_1)
-        pyxel.text(x - half_msg_width, y - 1- 7, msg, COL_1)
+        profiler.begin(DRAW)
+        self.drawScreen()
+        profiler.end(DRAW)
+        profiler.endFrame()
 
-        pyxel.text(x - half_msg_width - 1, y - 1- 7, msg, COL_1)
-        pyxel.text(x - half_msg_width - 1, y + 1- 7, msg, COL_1)
-        pyxel.text(x - half_msg_width + 1, y + 1- 7, msg, COL_1)
-        pyxel.text(x - half_msg_width + 1, y - 1- 7, msg, COL_1)
+        # overlay is not measured, it is drawn on top every frame
+        if self.is_profiler_overlay_visible:
+            self.drawProfilerOverlay()
 
-        pyxel.text(x - half_msg_width, y- 7, msg, COL_2)
+    def drawProfilerOverlay(self):
+        lines = self.profiler.getReportLines()
+        y = WINDOW_H - len(lines) * 6 - 2
+        pyxel.rect(0, y, WINDOW_W, WINDOW_H - y, 0)
+        pyxel.text(1, y + 1, "\n".join(lines), 7)
 
-    def draw(self):
+    def drawScreen(self):
+        if not self.is_retained_render:
+            self.drawFrame()
+            return
+
+        # nothing changed since last frame, screen already shows it
+        if not self.is_render_dirty:
+            return
+        self.is_render_dirty = False
+
+        if not self.is_background_baked:
+            self.bakeBackgrounds()
+        if self.prepareTexts():
+            self.is_full_redraw = True
+
+        column_keys = self.calcColumnKeys()
+        if self.is_full_redraw or self.is_game_over:
+            pyxel.blt(0, 0, BACKGROUND_BANK, self.getBackgroundU(), 0, WINDOW_W, WINDOW_H)
+            self.drawCardStacks()
+            if self.is_game_over:
+                self.drawGaveOver()
+            if self.is_stats_active:
+                self.drawStats()
+            # columns drawn alone would cover overlays
+            self.is_full_redraw = self.is_game_over or self.is_stats_active
+        else:
+            for column in range(COLUMNS_COUNT):
+                if column_keys[column] != self.column_keys[column]:
+                    self.drawColumn(column, column_keys)
+        self.column_keys = column_keys
+
+    def drawFrame(self):
+        self.prepareTexts()
         self.drawBackground()
+        if self.profiler is not None:
+            self.profiler.begin(TEXT)
         if self.is_instructions_active:
             self.drawInstructions()
         else:
             self.drawCotrollsInfo()
+        if self.profiler is not None:
+            self.profiler.end(TEXT)
 
         self.drawCardStacks()
 
         if self.is_game_over:
             self.drawGaveOver()
+        if self.is_stats_active:
+            self.drawStats()
 
         # debug
         # self.__drawDebug(1, 130)
@@ -867,8 +1719,51 @@ hearts and spades.
 
 
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="Pyxel Klondike")
+    parser.add_argument("--profile", action="store_true", help="show frame profiler overlay (toggle with P)")
+    parser.add_argument("--profile-csv", default=None, help="write per frame timings to csv file")
+    parser.add_argument("--auto-complete", choices=AUTO_COMPLETE_MODES, default=AUTO_COMPLETE_ANIMATED,
+                        help="how the game is finished once every card is face up")
+    parser.add_argument("--draw", type=int, choices=[1, 3], default=1, help="cards drawn from stock at once")
+    parser.add_argument("--redeals", type=int, default=None, help="times waste can be turned over, unlimited by default")
+    parser.add_argument("--any-to-empty", action="store_true", help="any card can go to empty tableau pile")
+    parser.add_argument("--min-difficulty", type=int, default=0, help="lowest deal pool level, 0 is the easiest")
+    parser.add_argument("--max-difficulty", type=int, default=None, help="highest deal pool level")
+    parser.add_argument("--record", default=None, help="log keys and mouse of the session to input log file")
+    parser.add_argument("--playback", default=None, help="play session back from input log file")
+    parser.add_argument("--max-speed", action="store_true", help="play back without window as fast as possible")
+    parser.add_argument("--synthetic-input", type=int, default=None,
+                        help="first write input log of this many random keys to playback file")
+    args = parser.parse_args()
 
-    game.initialize()
-    game.run()
-    game.finalize()
+    game = Game()
+    game.auto_complete_mode = args.auto_complete
+    game.rules = Rules(args.draw, args.redeals, args.any_to_empty)
+    game.min_difficulty = args.min_difficulty
+    game.max_difficulty = args.max_difficulty
+    game.profile_csv_path = args.profile_csv
+    if args.profile_csv is not None:
+        game.profiler = Profiler(csv_path=args.profile_csv)
+    if args.profile:
+        game.toggleProfiler()
+
+    if args.playback is not None:
+        if args.synthetic_input is not None:
+            writeRandomInputLog(args.playback, SYNTHETIC_KEYS, args.synthetic_input, game.rules,
+                                new_game_key=pyxel.KEY_N, new_game_every=SYNTHETIC_GAME_KEYS)
+        game.startPlayback(args.playback)
+    if args.record is not None:
+        game.startRecording(args.record)
+
+    if args.playback is not None and args.max_speed:
+        # load test, nothing is written to records and stats
+        game.records_path = None
+        game.stats_path = None
+        seconds = game.runHeadless()
+        print("{} frames, {} keys in {:.2f} sec, {:.0f} keys/sec".format(
+            game.frame, game.dispatched_events, seconds, game.dispatched_events / max(seconds, 1e-9)))
+        game.finalize()
+    else:
+        game.initialize()
+        game.run()
+        game.finalize()
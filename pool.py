@@ -0,0 +1,162 @@
+import argparse
+import math
+import os
+import random
+import struct
+
+from solver import SOLVED
+
+# Pool of pre-solved deal seeds graded by difficulty, built offline from batch.py results:
+#   python batch.py --stop 10000 --out results.csv
+#   python pool.py results.csv --out assets/deals.kdp
+# File layout:
+#   header  - b"KLDP" + version byte + levels count byte
+#   index   - for every level: first entry, entries count (<II)
+#   entries - fixed size, sorted by level: seed, length, nodes, branching * 100, stock passes
+# Only header and index are read on open, every lookup is one seek and one small read.
+MAGIC = b"KLDP"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+
+DIFFICULTY_LEVELS = 10  # level 0 is the easiest tenth of solved deals
+LEVEL_FORMAT = struct.Struct("<II")
+ENTRY_FORMAT = struct.Struct("<IHHHB")
+
+# weights of difficulty score, solution length is the base
+PASS_WEIGHT = 10
+NODES_WEIGHT = 20
+BRANCHING_WEIGHT = 5
+
+
+class PoolError(Exception):
+    pass
+
+
+class DealEntry:
+    def __init__(self, seed, length, nodes, branching, passes):
+        self.seed = seed
+        self.length = length
+        self.nodes = nodes
+        self.branching = branching
+        self.passes = passes
+
+    def calcDifficultyScore(self):
+        # longer solutions, more stock passes and harder search make harder deals
+        return (self.length + PASS_WEIGHT * self.passes + NODES_WEIGHT * math.log2(max(1, self.nodes))
+                + BRANCHING_WEIGHT * self.branching)
+
+
+def packEntry(entry):
+    return ENTRY_FORMAT.pack(
+        entry.seed, min(entry.length, 0xffff), min(entry.nodes, 0xffff),
+        min(int(round(entry.branching * 100)), 0xffff), min(entry.passes, 0xff))
+
+
+def unpackEntry(data):
+    seed, length, nodes, branching, passes = ENTRY_FORMAT.unpack(data)
+    return DealEntry(seed, length, nodes, branching / 100, passes)
+
+
+def readBatchResults(path):
+    # solved deals of batch.py csv
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line[0].isdigit():
+                continue
+            fields = line.rstrip("\n").split(",")
+            if len(fields) < 7 or fields[1] != SOLVED:
+                continue
+            entries.append(DealEntry(int(fields[0]), int(fields[3]), int(fields[2]), float(fields[5]), int(fields[6])))
+    return entries
+
+
+def splitLevels(entries, levels=DIFFICULTY_LEVELS):
+    # levels of equal size by difficulty score
+    entries = sorted(entries, key=lambda entry: (entry.calcDifficultyScore(), entry.seed))
+    return [entries[len(entries) * level // levels:len(entries) * (level + 1) // levels] for level in range(levels)]
+
+
+def writePool(path, entries, levels=DIFFICULTY_LEVELS):
+    level_entries = splitLevels(entries, levels)
+
+    data = bytearray(HEADER)
+    data.append(levels)
+    first = 0
+    for level in level_entries:
+        data += LEVEL_FORMAT.pack(first, len(level))
+        first += len(level)
+    for level in level_entries:
+        for entry in level:
+            data += packEntry(entry)
+
+    # pool is read by running games, so it is replaced as a whole
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class DealPool:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        header = self.file.read(len(HEADER) + 1)
+        if len(header) != len(HEADER) + 1 or header[:len(HEADER)] != HEADER:
+            self.file.close()
+            raise PoolError("{} is not a deal pool file".format(path))
+
+        levels = header[-1]
+        self.levels = [LEVEL_FORMAT.unpack(self.file.read(LEVEL_FORMAT.size)) for _ in range(levels)]
+        self.entries_offset = len(HEADER) + 1 + levels * LEVEL_FORMAT.size
+
+    def __len__(self):
+        return sum(count for first, count in self.levels)
+
+    def getLevelsCount(self):
+        return len(self.levels)
+
+    def getEntry(self, index):
+        self.file.seek(self.entries_offset + index * ENTRY_FORMAT.size)
+        data = self.file.read(ENTRY_FORMAT.size)
+        if len(data) != ENTRY_FORMAT.size:
+            raise PoolError("deal pool is truncated")
+        return unpackEntry(data)
+
+    def getRandomEntry(self, min_level=0, max_level=None, rng=random):
+        # random deal of difficulty level in [min_level, max_level], None if there are none
+        if max_level is None or max_level >= len(self.levels):
+            max_level = len(self.levels) - 1
+        levels = self.levels[max(0, min_level):max_level + 1]
+
+        # entries of neighbour levels follow each other in the file
+        total = sum(count for first, count in levels)
+        if not total:
+            return None
+        return self.getEntry(levels[0][0] + rng.randrange(total))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build deal pool from batch.py results")
+    parser.add_argument("results", help="csv written by batch.py")
+    parser.add_argument("--out", default=os.path.join("assets", "deals.kdp"))
+    parser.add_argument("--levels", type=int, default=DIFFICULTY_LEVELS)
+    args = parser.parse_args()
+
+    entries = readBatchResults(args.results)
+    if not entries:
+        raise PoolError("no solved deals in {}".format(args.results))
+    writePool(args.out, entries, args.levels)
+    print("{} deals in {} levels".format(len(entries), args.levels))
+
+
+if __name__ == "__main__":
+    main()
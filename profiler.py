@@ -0,0 +1,71 @@
+import time
+from collections import deque
+
+# Frame profiler: sections are timed with begin/end, every frame keeps total time of
+# every section, rolling window of frames gives percentiles for overlay.
+
+UPDATE = "update"
+NODES_UPDATE = "nodes"
+DRAW = "draw"
+CARD_BLITS = "cards"
+TEXT = "text"
+GAME_OVER = "over"
+
+SECTIONS = [UPDATE, NODES_UPDATE, DRAW, CARD_BLITS, TEXT, GAME_OVER]
+
+DEFAULT_WINDOW = 300  # frames, 10 seconds at 30 fps
+
+
+def calcPercentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return sorted_values[index]
+
+
+class Profiler:
+    def __init__(self, window=DEFAULT_WINDOW, csv_path=None):
+        self.samples = {name: deque(maxlen=window) for name in SECTIONS}
+        self.frame_times = dict.fromkeys(SECTIONS, 0.0)
+        self.start_times = {}
+        self.frame_index = 0
+
+        self.csv_file = None
+        if csv_path is not None:
+            self.csv_file = open(csv_path, "w")
+            self.csv_file.write("frame," + ",".join(name + "_ms" for name in SECTIONS) + "\n")
+
+    def begin(self, name):
+        self.start_times[name] = time.perf_counter()
+
+    def end(self, name):
+        self.frame_times[name] += time.perf_counter() - self.start_times[name]
+
+    def endFrame(self):
+        frame_times = self.frame_times
+        for name in SECTIONS:
+            self.samples[name].append(frame_times[name] * 1000)
+
+        if self.csv_file is not None:
+            self.csv_file.write("{},{}\n".format(
+                self.frame_index, ",".join("{:.4f}".format(frame_times[name] * 1000) for name in SECTIONS)))
+
+        self.frame_times = dict.fromkeys(SECTIONS, 0.0)
+        self.frame_index += 1
+
+    def getPercentiles(self, name):
+        # p50, p95, p99 in milliseconds
+        values = sorted(self.samples[name])
+        return calcPercentile(values, 50), calcPercentile(values, 95), calcPercentile(values, 99)
+
+    def getReportLines(self):
+        lines = ["MS     P50   P95   P99"]
+        for name in SECTIONS:
+            p50, p95, p99 = self.getPercentiles(name)
+            lines.append("{:<6}{:>5.2f}{:>6.2f}{:>6.2f}".format(name.upper(), p50, p95, p99))
+        return lines
+
+    def close(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
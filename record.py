@@ -0,0 +1,193 @@
+import os
+import struct
+
+from engine import Klondike, Rules, CARDS_COUNT, STANDARD_RULES
+from writer import BackgroundWriter
+
+# Game records file, append only:
+#   header  - b"KLDR" + version byte
+#   records - one after another:
+#       1 byte       - packed rules (version 2, version 1 records are standard rules games)
+#       52 bytes     - deal permutation, cards in the order they were put to stock
+#       4 bytes      - moves count, little endian
+#       2 bytes/move - (src << 4 | dst), count
+MAGIC = b"KLDR"
+VERSION = 2
+HEADER = MAGIC + bytes([VERSION])
+
+MOVES_COUNT_FORMAT = struct.Struct("<I")
+
+
+class RecordError(Exception):
+    pass
+
+
+class GameRecord:
+    def __init__(self, deal_cards, moves, rules=STANDARD_RULES):
+        self.deal_cards = list(deal_cards)
+        self.moves = list(moves)
+        self.rules = rules
+
+
+def packMoves(moves):
+    data = bytearray()
+    for src, dst, count in moves:
+        data.append(src << 4 | dst)
+        data.append(count)
+    return bytes(data)
+
+
+def unpackMoves(data):
+    return [(data[i] >> 4, data[i] & 0xf, data[i + 1]) for i in range(0, len(data), 2)]
+
+
+def packRecord(record):
+    if len(record.deal_cards) != CARDS_COUNT:
+        raise RecordError("deal must have {} cards".format(CARDS_COUNT))
+    return (bytes([record.rules.pack()]) + bytes(record.deal_cards) + MOVES_COUNT_FORMAT.pack(len(record.moves))
+            + packMoves(record.moves))
+
+
+def readVersion(f, path):
+    header = f.read(len(HEADER))
+    if len(header) != len(HEADER) or header[:len(MAGIC)] != MAGIC or not 1 <= header[-1] <= VERSION:
+        raise RecordError("{} is not a game records file".format(path))
+    return header[-1]
+
+
+def upgradeRecordsFile(path):
+    # rewrites records of older version in current format, so new records can be appended
+    with open(path, "rb") as f:
+        if readVersion(f, path) == VERSION:
+            return
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER)
+        try:
+            for record in readRecords(path):
+                f.write(packRecord(record))
+        except RecordError:
+            # partially written last record is dropped
+            pass
+    os.replace(temp_path, path)
+
+
+def getCompleteSize(path):
+    # bytes of header and complete records, a partially written last record is not counted
+    with open(path, "rb") as f:
+        readVersion(f, path)
+        size = f.seek(0, os.SEEK_END)
+        offset = len(HEADER)
+        while offset < size:
+            f.seek(offset + 1 + CARDS_COUNT)
+            moves_count_data = f.read(MOVES_COUNT_FORMAT.size)
+            if len(moves_count_data) != MOVES_COUNT_FORMAT.size:
+                break
+            moves_count, = MOVES_COUNT_FORMAT.unpack(moves_count_data)
+            end = offset + 1 + CARDS_COUNT + MOVES_COUNT_FORMAT.size + moves_count * 2
+            if end > size:
+                break
+            offset = end
+    return offset
+
+
+class RecordWriter:
+    def __init__(self, path):
+        is_new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new_file:
+            upgradeRecordsFile(path)
+        self.file = open(path, "ab")
+        if is_new_file:
+            self.file.write(HEADER)
+        else:
+            # records appended after a broken one could not be read
+            self.file.truncate(getCompleteSize(path))
+
+    def write(self, record):
+        self.file.write(packRecord(record))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordStore(BackgroundWriter):
+    errors = (OSError, RecordError)
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.writer = None
+        self.start()
+
+    def add(self, record):
+        self.put(record)
+
+    def openOutput(self):
+        self.writer = RecordWriter(self.path)
+
+    def writeItem(self, record):
+        self.writer.write(record)
+        self.writer.flush()
+
+    def closeOutput(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def readRecords(path):
+    # lazy, only one record is held in memory at a time
+    with open(path, "rb") as f:
+        version = readVersion(f, path)
+
+        while True:
+            rules = STANDARD_RULES
+            if version >= 2:
+                rules_code = f.read(1)
+                if not rules_code:
+                    return
+                try:
+                    rules = Rules.unpack(rules_code[0])
+                except ValueError as error:
+                    raise RecordError("bad rules in {}: {}".format(path, error))
+            deal_cards = f.read(CARDS_COUNT)
+            if not deal_cards and version < 2:
+                return
+            moves_count_data = f.read(MOVES_COUNT_FORMAT.size)
+            if len(deal_cards) != CARDS_COUNT or len(moves_count_data) != MOVES_COUNT_FORMAT.size:
+                raise RecordError("truncated record in {}".format(path))
+
+            moves_count, = MOVES_COUNT_FORMAT.unpack(moves_count_data)
+            moves_data = f.read(moves_count * 2)
+            if len(moves_data) != moves_count * 2:
+                raise RecordError("truncated record in {}".format(path))
+
+            yield GameRecord(deal_cards, unpackMoves(moves_data), rules)
+
+
+def recordGame(game):
+    return GameRecord(game.deal_cards, game.getMoves(), game.rules)
+
+
+def replayRecord(record, game=None, validate=False):
+    if game is None:
+        game = Klondike(record.rules)
+    else:
+        game.setRules(record.rules)
+    game.deal(record.deal_cards)
+    for move in record.moves:
+        if validate:
+            if not game.makeMove(move):
+                raise RecordError("illegal move {} in record".format(move))
+        else:
+            game.applyMove(move)
+    return game
@@ -0,0 +1,184 @@
+import os
+import struct
+
+from engine import (
+    Rules, PILES_COUNT, CARDS_COUNT, STOCK, WASTE, FOUNDATIONS, TABLEAUS, FACED, CARD_RANK, CARD_SUIT, CARD_IS_RED
+)
+from state import CompactState, STATE_SIZE
+from writer import BackgroundWriter
+
+# Saved game in progress, fixed 86 bytes:
+#   header - b"KLDG" + version byte
+#   fields - packed rules, seed, elapsed ms, moves count, redeals, cursor pile and card index,
+#            pile the hand was taken from and number of cards in hand (SAVE_FORMAT)
+#   state  - compact state (see state), cards in hand still lie on their pile
+# NO_INDEX stands for no cursor, empty pile or empty hand.
+# The file is replaced atomically by a BackgroundWriter.
+MAGIC = b"KLDG"
+VERSION = 2
+HEADER = MAGIC + bytes([VERSION])
+SAVE_FORMAT = struct.Struct("<BIIHBBBBB")
+SAVE_SIZE = len(HEADER) + SAVE_FORMAT.size + STATE_SIZE
+ELAPSED_OFFSET = len(HEADER) + struct.calcsize("<BI")
+ELAPSED_SIZE = 4
+NO_INDEX = 0xff
+
+
+class SaveError(Exception):
+    pass
+
+
+class SavedGame:
+    def __init__(self, rules, seed, elapsed, moves, redeals, cursor, hand, state):
+        self.rules = rules
+        self.seed = seed
+        self.elapsed = elapsed  # milliseconds played
+        self.moves = moves  # moves made, history itself is not saved
+        self.redeals = redeals
+        self.cursor = cursor  # (pile, card index or None) or None
+        self.hand = hand  # (pile, count) or None
+        self.state = state
+
+
+def packIndex(index):
+    return NO_INDEX if index is None else index
+
+
+def unpackIndex(value):
+    return None if value == NO_INDEX else value
+
+
+def packSave(saved):
+    cursor_pile, cursor_index = saved.cursor if saved.cursor is not None else (None, None)
+    hand_pile, hand_count = saved.hand if saved.hand is not None else (None, 0)
+    return HEADER + SAVE_FORMAT.pack(
+        saved.rules.pack(), saved.seed, min(saved.elapsed, 0xffffffff), min(saved.moves, 0xffff),
+        min(saved.redeals, 0xff), packIndex(cursor_pile), packIndex(cursor_index), packIndex(hand_pile),
+        hand_count) + saved.state.data
+
+
+def checkState(state):
+    # engine indexes rely on layouts real games have, anything else is a corrupt save
+    data = state.data[STATE_SIZE - CARDS_COUNT:]
+    if any(card & ~FACED >= CARDS_COUNT for card in data) or len(set(card & ~FACED for card in data)) != CARDS_COUNT:
+        raise SaveError("bad cards")
+    piles = state.toPiles()
+    if any(card & FACED for card in piles[STOCK]):
+        raise SaveError("face up card in stock")
+    for pile in [WASTE] + list(FOUNDATIONS):
+        if not all(card & FACED for card in piles[pile]):
+            raise SaveError("face down card in pile {}".format(pile))
+    for pile in FOUNDATIONS:
+        cards = piles[pile]
+        if any(CARD_RANK[card] != rank or CARD_SUIT[card] != CARD_SUIT[cards[0]] for rank, card in enumerate(cards)):
+            raise SaveError("bad foundation {}".format(pile))
+    for pile in TABLEAUS:
+        cards = piles[pile]
+        for under_card, card in zip(cards, cards[1:]):
+            if not card & FACED and under_card & FACED:
+                raise SaveError("face down card over face up card in pile {}".format(pile))
+            if (card & FACED and under_card & FACED
+                    and (CARD_RANK[card] != CARD_RANK[under_card] - 1 or CARD_IS_RED[card] == CARD_IS_RED[under_card])):
+                raise SaveError("bad sequence in pile {}".format(pile))
+
+
+def unpackSave(data):
+    if len(data) != SAVE_SIZE or not data.startswith(HEADER):
+        raise SaveError("not a saved game")
+    (rules_code, seed, elapsed, moves, redeals, cursor_pile, cursor_index, hand_pile,
+     hand_count) = SAVE_FORMAT.unpack_from(data, len(HEADER))
+    try:
+        rules = Rules.unpack(rules_code)
+    except ValueError as error:
+        raise SaveError("bad rules: {}".format(error))
+    state = CompactState(data[len(HEADER) + SAVE_FORMAT.size:])
+
+    cursor_pile = unpackIndex(cursor_pile)
+    hand_pile = unpackIndex(hand_pile)
+    if sum(state.data[:PILES_COUNT]) != STATE_SIZE - PILES_COUNT:
+        raise SaveError("bad state")
+    checkState(state)
+    for pile in (cursor_pile, hand_pile):
+        if pile is not None and pile >= PILES_COUNT:
+            raise SaveError("bad pile {}".format(pile))
+    cursor = None
+    if cursor_pile is not None:
+        cursor_index = unpackIndex(cursor_index)
+        if cursor_index is not None and cursor_index >= state.getPileLength(cursor_pile):
+            raise SaveError("bad cursor")
+        cursor = (cursor_pile, cursor_index)
+    hand = None
+    if hand_pile is not None and hand_count:
+        if hand_count > state.getPileLength(hand_pile):
+            raise SaveError("bad hand")
+        if not all(card & FACED for card in state.getPileCards(hand_pile)[-hand_count:]):
+            raise SaveError("face down card in hand")
+        hand = (hand_pile, hand_count)
+    return SavedGame(rules, seed, elapsed, moves, redeals, cursor, hand, state)
+
+
+def getGameKey(data):
+    # save without elapsed time, equal keys are the same game position
+    return data[:ELAPSED_OFFSET] + data[ELAPSED_OFFSET + ELAPSED_SIZE:]
+
+
+def loadSave(path):
+    # saved game or None when there is no valid one
+    try:
+        with open(path, "rb") as f:
+            data = f.read(SAVE_SIZE + 1)
+    except OSError:
+        return None
+    try:
+        return unpackSave(data)
+    except (SaveError, ValueError):
+        return None
+
+
+def writeSave(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def removeSave(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SaveWriter(BackgroundWriter):
+    # only the latest save matters
+    is_latest_only = True
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.last_key = None
+        self.start()
+
+    def save(self, data, is_forced=False):
+        # games which only played on in time are not written again, unless forced
+        key = getGameKey(data)
+        if key == self.last_key and not is_forced:
+            return
+        self.last_key = key
+        self.put(data)
+
+    def remove(self):
+        if self.last_key is None and not os.path.exists(self.path):
+            return
+        self.last_key = None
+        self.put(b"")
+
+    def writeItem(self, data):
+        # a failed write is retried with the next save
+        try:
+            if data:
+                writeSave(self.path, data)
+            else:
+                removeSave(self.path)
+        except OSError as error:
+            self.error = error
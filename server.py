@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+from engine import Klondike, Rules, STANDARD_RULES, PILES_COUNT, FOUNDATIONS, RANKS_COUNT, FACED, shuffledDeck
+from state import CompactState, CARDS_OFFSET, LENGTHS_OFFSET
+from pool import DealPool, PoolError
+
+# Many independent games in one process for a web front end, JSON lines protocol:
+#   {"id": 1, "op": "new", "seed": 7, "draw": 3, "redeals": 2, "any_to_empty": false}  (all but op optional)
+#       -> {"id": 1, "session": 5, "seed": 7, "piles": [[card, ...] x 13]}  (seed only when it was requested)
+#   {"id": 2, "op": "move", "session": 5, "move": [src, dst, count]}
+#   {"id": 3, "op": "undo" | "redo" | "auto", "session": 5}
+#       -> {"id": 2, "ok": true, "diff": [[pile, [card, ...]], ...], "won": false}
+#   {"id": 4, "op": "state" | "close", "session": 5}
+# Piles and cards are encoded like in engine: pile indexes of engine, card = suit * 13 + rank | FACED.
+# Face down cards are sent as HIDDEN_CARD, so clients can not read the deal; for the same reason
+# seeds picked by the server are not sent, shuffledDeck(seed) is the whole deal.
+# A diff lists every pile whose cards changed with its new cards.
+# An idle session is its compact state and move history only, one engine is loaded with the state
+# of the session a request is for, so memory does not grow with engines and requests are
+# applied one after another from a single asyncio queue.
+DEFAULT_MAX_SESSIONS = 100000
+MAX_SEED = 2 ** 32
+HIDDEN_CARD = -1
+
+
+class ServerError(Exception):
+    pass
+
+
+class Session:
+    __slots__ = ("id", "rules", "seed", "is_seed_public", "state", "redeals", "history", "redo_history")
+
+    def __init__(self, id, rules, seed, engine, is_seed_public=False):
+        self.id = id
+        self.rules = rules
+        self.seed = seed
+        self.is_seed_public = is_seed_public  # seed was chosen by the client
+        self.state = CompactState.fromPiles(engine.piles)
+        self.redeals = engine.redeals
+        self.history = engine.history
+        self.redo_history = engine.redo_history
+
+
+def getVisiblePile(cards):
+    return [card if card & FACED else HIDDEN_CARD for card in cards]
+
+
+def getVisiblePiles(state):
+    return [getVisiblePile(cards) for cards in state.toPiles()]
+
+
+def diffStates(old_data, new_data):
+    # [pile, cards] of every pile which differs, in one pass over both states
+    diff = []
+    old_offset = new_offset = CARDS_OFFSET
+    for pile in range(PILES_COUNT):
+        old_length = old_data[LENGTHS_OFFSET + pile]
+        new_length = new_data[LENGTHS_OFFSET + pile]
+        old_cards = old_data[old_offset:old_offset + old_length]
+        new_cards = new_data[new_offset:new_offset + new_length]
+        if old_cards != new_cards:
+            diff.append([pile, getVisiblePile(new_cards)])
+        old_offset += old_length
+        new_offset += new_length
+    return diff
+
+
+def isInt(value):
+    # json true and false are not numbers here
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parseRules(request):
+    draw = request.get("draw", 1)
+    redeals = request.get("redeals")
+    if not isInt(draw) or (redeals is not None and not isInt(redeals)):
+        raise ServerError("bad rules")
+    try:
+        return Rules(draw, redeals, bool(request.get("any_to_empty", False)))
+    except (TypeError, ValueError) as error:
+        raise ServerError(str(error))
+
+
+class SessionManager:
+    def __init__(self, deal_pool=None, seed=None, max_sessions=DEFAULT_MAX_SESSIONS):
+        self.sessions = {}
+        self.next_id = 1
+        self.max_sessions = max_sessions
+        # own generator, sessions never touch module random
+        self.rng = random.Random(seed)
+        self.deal_pool = deal_pool
+        self.engine = Klondike()
+        self.loaded = None  # session whose state engine holds
+
+    def createSession(self, rules=STANDARD_RULES, seed=None):
+        if len(self.sessions) >= self.max_sessions:
+            raise ServerError("too many sessions")
+        is_seed_public = seed is not None
+        if seed is None:
+            entry = None
+            if self.deal_pool is not None and rules.isStandard():
+                entry = self.deal_pool.getRandomEntry(rng=self.rng)
+            seed = entry.seed if entry is not None else self.rng.randrange(MAX_SEED)
+
+        engine = self.engine
+        engine.setRules(rules)
+        engine.deal(shuffledDeck(seed))
+        session = Session(self.next_id, rules, seed, engine, is_seed_public)
+        self.next_id += 1
+        self.sessions[session.id] = session
+        self.loaded = session
+        return session
+
+    def getSession(self, session_id):
+        if not isInt(session_id):
+            raise ServerError("bad session {}".format(session_id))
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ServerError("no session {}".format(session_id))
+        return session
+
+    def closeSession(self, session_id):
+        session = self.getSession(session_id)
+        del self.sessions[session_id]
+        if self.loaded is session:
+            self.loaded = None
+
+    def loadSession(self, session):
+        # engine keeps the last session, so moves of one session in a row do not reload it
+        if self.loaded is session:
+            return self.engine
+        engine = self.engine
+        engine.setRules(session.rules)
+        engine.setPiles(session.state.toPiles(), session.redeals)
+        # histories are shared, engine appends to arrays of the session
+        engine.history = session.history
+        engine.redo_history = session.redo_history
+        self.loaded = session
+        return engine
+
+    def update(self, session, is_changed):
+        # stores engine state to session, returns response of the change
+        engine = self.engine
+        diff = []
+        if is_changed:
+            new_state = CompactState.fromPiles(engine.piles)
+            diff = diffStates(session.state.data, new_state.data)
+            session.state = new_state
+            session.redeals = engine.redeals
+        return {"ok": is_changed, "diff": diff, "won": engine.isWon()}
+
+    def applyMove(self, session_id, move):
+        session = self.getSession(session_id)
+        engine = self.loadSession(session)
+        if not isinstance(move, list) or len(move) != 3 or not all(isInt(value) for value in move):
+            raise ServerError("bad move {}".format(move))
+        src, dst, count = move
+        if not 0 <= src < PILES_COUNT or not 0 <= dst < PILES_COUNT or not 0 <= count < 256:
+            raise ServerError("bad move {}".format(move))
+        return self.update(session, engine.makeMove((src, dst, count)))
+
+    def undo(self, session_id):
+        session = self.getSession(session_id)
+        return self.update(session, self.loadSession(session).undo() is not None)
+
+    def redo(self, session_id):
+        session = self.getSession(session_id)
+        return self.update(session, self.loadSession(session).redo() is not None)
+
+    def autoComplete(self, session_id):
+        session = self.getSession(session_id)
+        return self.update(session, len(self.loadSession(session).autoComplete()) > 0)
+
+    def getState(self, session_id):
+        session = self.getSession(session_id)
+        # answered from compact state, engine stays with the session it holds
+        state = session.state
+        response = {"session": session.id, "piles": getVisiblePiles(state), "moves": len(session.history),
+                    "won": all(state.getPileLength(pile) == RANKS_COUNT for pile in FOUNDATIONS)}
+        if session.is_seed_public:
+            response["seed"] = session.seed
+        return response
+
+    def handle(self, request):
+        # response of one request, errors are responses too
+        try:
+            if not isinstance(request, dict):
+                raise ServerError("request must be an object")
+            op = request.get("op")
+            if op == "new":
+                seed = request.get("seed")
+                if seed is not None and (not isInt(seed) or not 0 <= seed < MAX_SEED):
+                    raise ServerError("bad seed {}".format(seed))
+                session = self.createSession(parseRules(request), seed)
+                response = {"session": session.id, "piles": getVisiblePiles(session.state)}
+                if session.is_seed_public:
+                    response["seed"] = session.seed
+            elif op == "move":
+                response = self.applyMove(request.get("session"), request.get("move"))
+            elif op == "undo":
+                response = self.undo(request.get("session"))
+            elif op == "redo":
+                response = self.redo(request.get("session"))
+            elif op == "auto":
+                response = self.autoComplete(request.get("session"))
+            elif op == "state":
+                response = self.getState(request.get("session"))
+            elif op == "close":
+                self.closeSession(request.get("session"))
+                response = {"ok": True}
+            else:
+                raise ServerError("unknown op {}".format(op))
+        except ServerError as error:
+            response = {"error": str(error)}
+        except Exception as error:
+            # engine may hold a half applied request, the next one loads its session again
+            self.loaded = None
+            response = {"error": "internal error: {!r}".format(error)}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    def handleLine(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"error": "bad json"}
+        return self.handle(request)
+
+
+class Server:
+    # requests of all connections go through one queue to one worker, so sessions need no locks
+    def __init__(self, manager):
+        self.manager = manager
+        self.queue = None  # created in the running loop
+
+    async def work(self):
+        while True:
+            line, reply = await self.queue.get()
+            try:
+                reply(json.dumps(self.manager.handleLine(line), separators=(",", ":")) + "\n")
+            except Exception as error:
+                # one bad request or closed connection never stops answering the others
+                sys.stderr.write("request failed: {!r}\n".format(error))
+            finally:
+                self.queue.task_done()
+
+    async def serveConnection(self, reader, writer):
+        def reply(text):
+            writer.write(text.encode())
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await self.queue.put((line, reply))
+            await writer.drain()
+        writer.close()
+
+    async def serveSocket(self, host, port):
+        self.queue = asyncio.Queue()
+        worker = asyncio.ensure_future(self.work())
+        server = await asyncio.start_server(self.serveConnection, host, port)
+        async with server:
+            await server.serve_forever()
+        worker.cancel()
+
+    async def serveStdio(self):
+        self.queue = asyncio.Queue()
+        loop = asyncio.get_event_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        def reply(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        worker = asyncio.ensure_future(self.work())
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await self.queue.put((line, reply))
+        # answer everything read before end of input
+        await self.queue.join()
+        worker.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many Klondike games, JSON lines over stdin/stdout or socket")
+    parser.add_argument("--port", type=int, default=None, help="listen on local socket instead of stdin/stdout")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--seed", type=int, default=None, help="seed of new deals")
+    parser.add_argument("--pool", default=os.path.join("assets", "deals.kdp"), help="deal pool of standard deals")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS)
+    args = parser.parse_args()
+
+    deal_pool = None
+    if args.pool and os.path.exists(args.pool):
+        try:
+            deal_pool = DealPool(args.pool)
+        except (OSError, PoolError):
+            deal_pool = None
+
+    server = Server(SessionManager(deal_pool, args.seed, args.max_sessions))
+    try:
+        if args.port is not None:
+            asyncio.run(server.serveSocket(args.host, args.port))
+        else:
+            asyncio.run(server.serveStdio())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if deal_pool is not None:
+            deal_pool.close()
+
+
+if __name__ == "__main__":
+    main()
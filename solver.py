@@ -0,0 +1,245 @@
+import time
+
+from engine import (
+    Klondike, STOCK, WASTE, FOUNDATION_FIRST, TABLEAU_FIRST, TABLEAUS, FACED, CARD_RANK, CARD_SUIT, DRAW_MOVE,
+    STANDARD_RULES
+)
+from state import packState
+
+# Depth first search over engine moves with a transposition table of packed states.
+# Flips and safe foundation moves are played automatically, so they never branch.
+# Search is exhaustive except for moves which can not change the outcome
+# (king shuffles between empty columns, splitting a run for nothing), so
+# UNSOLVABLE is reported only when search finished without hitting a limit.
+
+SOLVED = "solved"
+UNSOLVABLE = "unsolvable"
+UNKNOWN = "unknown"
+
+DEFAULT_MAX_NODES = 50000
+DEFAULT_MAX_TIME = 0.1  # seconds
+
+
+class SolverResult:
+    def __init__(self, status, moves, nodes, elapsed, branching=0.0):
+        self.status = status
+        self.moves = moves
+        self.nodes = nodes
+        self.elapsed = elapsed
+        # average number of candidate moves of searched position
+        self.branching = branching
+
+    def isSolved(self):
+        return self.status == SOLVED
+
+    def getStockPasses(self):
+        # number of times waste was turned over in solution
+        if self.moves is None:
+            return 0
+        return sum(1 for move in self.moves if move[1] == STOCK)
+
+
+def playAutoMoves(game):
+    piles = game.piles
+    while True:
+        move = game.getSafeFoundationMove()
+        if move is None:
+            for pile in range(TABLEAU_FIRST, len(piles)):
+                if piles[pile] and not piles[pile][-1] & FACED:
+                    move = (pile, pile, 0)
+                    break
+            else:
+                return
+        game.applyMove(move)
+
+
+def canPlayToFoundation(game, card):
+    return CARD_RANK[card] == game.foundation_ranks[CARD_SUIT[card]]
+
+
+def getStateKey(piles):
+    # tableau columns order does not matter for solvability
+    return packState(piles[:TABLEAU_FIRST] + sorted(piles[TABLEAU_FIRST:]))
+
+
+def getGameStateKey(game):
+    return getStateKey(game.piles)
+
+
+def getRedealsStateKey(game):
+    # with limited redeals same piles with fewer redeals left are a different position
+    return getStateKey(game.piles) + bytes([game.redeals])
+
+
+def getStockMoves(game):
+    # instead of single draws, stock is searched as macro moves:
+    # draw (and turn over waste) until a card can be played, then play it.
+    # Valid for draw-1 with unlimited redeals only, where every stock card can be reached.
+    piles = game.piles
+    stock = piles[STOCK]
+    waste = piles[WASTE]
+
+    ranks = game.foundation_ranks
+    empty_tableau = None
+    for dst in TABLEAUS:
+        if not piles[dst]:
+            empty_tableau = dst
+            break
+
+    # cards in the order they show up on waste top, current waste top is played directly
+    cycle = stock[::-1] + waste[:-1]
+    recycle = (WASTE, STOCK, len(stock) + len(waste))
+    macros = []
+
+    for index, card in enumerate(cycle):
+        rank = CARD_RANK[card]
+        suit = CARD_SUIT[card]
+
+        moves = []
+        if rank == ranks[suit]:
+            moves.append((WASTE, game.getFoundationPile(suit), 1))
+        for dst in game.getAcceptingPiles(card):
+            moves.append((WASTE, dst, 1))
+        if empty_tableau is not None and game.checkPlaceToEmptyPile(card, empty_tableau):
+            moves.append((WASTE, empty_tableau, 1))
+        if not moves:
+            continue
+
+        if index < len(stock):
+            draws = (DRAW_MOVE,) * (index + 1)
+        else:
+            draws = (DRAW_MOVE,) * len(stock) + (recycle,) + (DRAW_MOVE,) * (index - len(stock) + 1)
+        for move in moves:
+            macros.append((85 if move[1] < TABLEAU_FIRST else 65, draws + (move,)))
+
+    return macros
+
+
+def getSingleStockMoves(game):
+    # draw-3 or limited redeals: stock is searched move by move after everything else
+    move = game.getStockMove()
+    if move is None:
+        return []
+    return [(40, (move,))]
+
+
+def getOrderedMoves(game, get_stock_moves=getStockMoves):
+    piles = game.piles
+    scored = []
+
+    for score, macro in get_stock_moves(game):
+        scored.append((score, len(macro), macro))
+
+    for move in game.getLegalMoves():
+        src, dst, count = move
+
+        if src == STOCK or dst == STOCK:
+            # covered by stock macro moves
+            continue
+        elif src < TABLEAU_FIRST and src >= FOUNDATION_FIRST:
+            if dst < TABLEAU_FIRST:
+                # ace from one foundation to another changes nothing
+                continue
+            score = 5
+        elif dst < TABLEAU_FIRST:
+            score = 90
+        elif src == WASTE:
+            score = 70
+        else:
+            src_pile = piles[src]
+            if count == len(src_pile):
+                if not piles[dst]:
+                    # king with nothing under it to another empty column
+                    continue
+                score = 60
+            elif not src_pile[-count - 1] & FACED:
+                # opens card, prefer columns with more hidden cards
+                score = 80 + len(src_pile) - count
+            elif canPlayToFoundation(game, src_pile[-count - 1]):
+                # splits run to free card for foundation
+                score = 50
+            else:
+                continue
+        scored.append((score, 1, (move,)))
+
+    # best score first, shorter macros first
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [macro for score, length, macro in scored]
+
+
+class Solver:
+    def __init__(self, max_nodes=DEFAULT_MAX_NODES, max_time=DEFAULT_MAX_TIME, rules=STANDARD_RULES):
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.rules = rules
+        # search flavour is chosen once for the rules
+        if rules.draw_count == 1 and rules.max_redeals is None:
+            self.get_stock_moves = getStockMoves
+            self.get_state_key = getGameStateKey
+        else:
+            self.get_stock_moves = getSingleStockMoves
+            self.get_state_key = getGameStateKey if rules.max_redeals is None else getRedealsStateKey
+
+    def solve(self, piles, redeals=0):
+        start_time = time.perf_counter()
+        deadline = start_time + self.max_time if self.max_time is not None else None
+        get_stock_moves = self.get_stock_moves
+        get_state_key = self.get_state_key
+
+        game = Klondike(self.rules)
+        game.setPiles(piles, redeals)
+        playAutoMoves(game)
+
+        nodes = 0
+        visited = {get_state_key(game)}
+        # every frame keeps its remaining moves and history length to undo back to
+        ordered_moves = getOrderedMoves(game, get_stock_moves)
+        candidates = len(ordered_moves)
+        frames = [(iter(ordered_moves), len(game.history))]
+        status = UNSOLVABLE
+
+        while frames:
+            if game.isWon():
+                status = SOLVED
+                break
+
+            moves, history_length = frames[-1]
+            while len(game.history) > history_length:
+                game.undo()
+
+            macro = next(moves, None)
+            if macro is None:
+                frames.pop()
+                continue
+
+            for move in macro:
+                game.applyMove(move)
+            playAutoMoves(game)
+
+            key = get_state_key(game)
+            if key in visited:
+                continue
+            visited.add(key)
+
+            nodes += 1
+            if self.max_nodes is not None and nodes >= self.max_nodes:
+                status = UNKNOWN
+                break
+            if deadline is not None and not nodes & 0x3f and time.perf_counter() > deadline:
+                status = UNKNOWN
+                break
+
+            ordered_moves = getOrderedMoves(game, get_stock_moves)
+            candidates += len(ordered_moves)
+            frames.append((iter(ordered_moves), len(game.history)))
+
+        if game.isWon():
+            status = SOLVED
+
+        moves = game.getMoves() if status == SOLVED else None
+        branching = candidates / (nodes + 1)
+        return SolverResult(status, moves, nodes, time.perf_counter() - start_time, branching)
+
+
+def solve(piles, max_nodes=DEFAULT_MAX_NODES, max_time=DEFAULT_MAX_TIME, rules=STANDARD_RULES):
+    return Solver(max_nodes, max_time, rules).solve(piles)
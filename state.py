@@ -0,0 +1,105 @@
+from itertools import chain
+
+from engine import STOCK, PILES_COUNT, CARDS_COUNT, FACED, CARD_MASK
+
+# Compact Klondike state, fixed 65 bytes layout:
+#   [0:13]  - length of every pile
+#   [13:65] - encoded cards (see engine) of all piles, bottom to top, pile after pile
+# Copying, hashing and comparing a state are plain bytes operations.
+LENGTHS_OFFSET = 0
+CARDS_OFFSET = PILES_COUNT
+STATE_SIZE = CARDS_OFFSET + CARDS_COUNT
+
+
+def packState(piles):
+    return bytes([len(pile) for pile in piles]) + bytes(chain.from_iterable(piles))
+
+
+def unpackState(data):
+    piles = []
+    offset = CARDS_OFFSET
+    for length in data[LENGTHS_OFFSET:CARDS_OFFSET]:
+        piles.append(list(data[offset:offset + length]))
+        offset += length
+    return piles
+
+
+class CompactState:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        if len(data) != STATE_SIZE:
+            raise ValueError("compact state must be {} bytes, got {}".format(STATE_SIZE, len(data)))
+        self.data = bytes(data)
+
+    @classmethod
+    def fromPiles(cls, piles):
+        return cls(packState(piles))
+
+    def toPiles(self):
+        return unpackState(self.data)
+
+    def __eq__(self, other):
+        return isinstance(other, CompactState) and self.data == other.data
+
+    def __hash__(self):
+        return hash(self.data)
+
+    def copy(self):
+        # data is immutable, so the copy shares it
+        return CompactState(self.data)
+
+    def getPileLength(self, pile):
+        return self.data[LENGTHS_OFFSET + pile]
+
+    def getPileOffset(self, pile):
+        return CARDS_OFFSET + sum(self.data[LENGTHS_OFFSET:LENGTHS_OFFSET + pile])
+
+    def getPileCards(self, pile):
+        offset = self.getPileOffset(pile)
+        return self.data[offset:offset + self.getPileLength(pile)]
+
+    def getTopCard(self, pile):
+        length = self.getPileLength(pile)
+        if not length:
+            return None
+        return self.data[self.getPileOffset(pile) + length - 1]
+
+    def iterCards(self):
+        # yields (pile, index, card) in drawing order
+        offset = CARDS_OFFSET
+        for pile, length in enumerate(self.data[LENGTHS_OFFSET:CARDS_OFFSET]):
+            for index in range(length):
+                yield pile, index, self.data[offset + index]
+            offset += length
+
+    def applyMove(self, move):
+        # same move semantics as Klondike.applyMove, returns new state
+        src, dst, count = move
+        data = bytearray(self.data)
+
+        src_length = data[LENGTHS_OFFSET + src]
+        src_end = self.getPileOffset(src) + src_length
+
+        if src == dst:
+            data[src_end - 1] |= FACED
+            return CompactState(data)
+
+        if dst == STOCK:
+            # waste follows stock, so turning it over happens in place
+            waste = data[src_end - count:src_end]
+            data[src_end - count:src_end] = bytes(card & CARD_MASK for card in reversed(waste))
+        else:
+            cards = data[src_end - count:src_end]
+            if src == STOCK:
+                # drawn one by one, so drawn cards come to waste in reverse order
+                cards = bytearray(card | FACED for card in reversed(cards))
+            del data[src_end - count:src_end]
+            dst_end = CARDS_OFFSET + sum(data[LENGTHS_OFFSET:LENGTHS_OFFSET + dst + 1])
+            if dst > src:
+                dst_end -= count
+            data[dst_end:dst_end] = cards
+
+        data[LENGTHS_OFFSET + src] -= count
+        data[LENGTHS_OFFSET + dst] += count
+        return CompactState(data)
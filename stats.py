@@ -0,0 +1,258 @@
+import argparse
+import os
+import struct
+import time
+
+from engine import Rules
+from writer import BackgroundWriter
+
+# Statistics of finished games, append only journal:
+#   header  - b"KLDS" + version byte
+#   entries - fixed size: finish time (unix seconds), seed, duration ms, moves count, packed rules, is won
+# Aggregates are folded in one entry at a time, the store keeps them in memory and checkpoints them
+# to a side file, so opening the store only folds entries written after the last checkpoint.
+#   checkpoint - header + entries count + aggregates (SUMMARY_FORMAT)
+# Files are written by a BackgroundWriter.
+MAGIC = b"KLDS"
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+
+ENTRY_FORMAT = struct.Struct("<IIIHBB")
+SUMMARY_FORMAT = struct.Struct("<IIIIQQQ")
+CHECKPOINT_SUFFIX = ".sum"
+CHECKPOINT_INTERVAL = 64  # entries between checkpoints
+READ_CHUNK_ENTRIES = 4096
+
+
+class StatsError(Exception):
+    pass
+
+
+class GameStats:
+    def __init__(self, finished_at, seed, duration, moves, rules, is_won):
+        self.finished_at = finished_at
+        self.seed = seed
+        self.duration = duration  # milliseconds
+        self.moves = moves
+        self.rules = rules
+        self.is_won = is_won
+
+
+def packEntry(entry):
+    return ENTRY_FORMAT.pack(
+        int(entry.finished_at), entry.seed, min(entry.duration, 0xffffffff), min(entry.moves, 0xffff),
+        entry.rules.pack(), int(entry.is_won))
+
+
+def entryFromFields(fields):
+    finished_at, seed, duration, moves, rules_code, is_won = fields
+    return GameStats(finished_at, seed, duration, moves, Rules.unpack(rules_code), bool(is_won))
+
+
+def unpackEntry(data):
+    return entryFromFields(ENTRY_FORMAT.unpack(data))
+
+
+class StatsSummary:
+    # aggregates of any number of games, every game is added in constant time
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.streak = 0  # current win streak
+        self.best_streak = 0
+        self.total_time = 0  # milliseconds
+        self.won_time = 0
+        self.total_moves = 0
+
+    def add(self, is_won, duration, moves):
+        self.games += 1
+        self.total_time += duration
+        self.total_moves += moves
+        if is_won:
+            self.wins += 1
+            self.won_time += duration
+            self.streak += 1
+            self.best_streak = max(self.best_streak, self.streak)
+        else:
+            self.streak = 0
+
+    def addEntry(self, entry):
+        self.add(entry.is_won, entry.duration, entry.moves)
+
+    def getWinRate(self):
+        return self.wins / self.games if self.games else 0.0
+
+    def getAverageTime(self):
+        # seconds per deal
+        return self.total_time / self.games / 1000 if self.games else 0.0
+
+    def getAverageWinTime(self):
+        return self.won_time / self.wins / 1000 if self.wins else 0.0
+
+    def getAverageMoves(self):
+        return self.total_moves / self.games if self.games else 0.0
+
+    def pack(self):
+        return SUMMARY_FORMAT.pack(self.games, self.wins, self.streak, self.best_streak,
+                                   self.total_time, self.won_time, self.total_moves)
+
+    @staticmethod
+    def unpack(data):
+        summary = StatsSummary()
+        (summary.games, summary.wins, summary.streak, summary.best_streak,
+         summary.total_time, summary.won_time, summary.total_moves) = SUMMARY_FORMAT.unpack(data)
+        return summary
+
+
+def readHeader(f, path):
+    if f.read(len(HEADER)) != HEADER:
+        raise StatsError("{} is not a stats file".format(path))
+
+
+def countEntries(path):
+    size = os.path.getsize(path) - len(HEADER)
+    return max(0, size) // ENTRY_FORMAT.size
+
+
+def iterEntryFields(path, start=0):
+    # raw entry tuples from start index on, read in chunks, a partially written last entry is skipped
+    with open(path, "rb") as f:
+        readHeader(f, path)
+        f.seek(len(HEADER) + start * ENTRY_FORMAT.size)
+        while True:
+            data = f.read(READ_CHUNK_ENTRIES * ENTRY_FORMAT.size)
+            data = data[:len(data) - len(data) % ENTRY_FORMAT.size]
+            if not data:
+                return
+            yield from ENTRY_FORMAT.iter_unpack(data)
+
+
+def readEntries(path, start=0):
+    for fields in iterEntryFields(path, start):
+        yield entryFromFields(fields)
+
+
+def summarize(path, rules=None, since=None, start=0, summary=None):
+    # folds entries from start index into summary, optionally only games of rules and finished since
+    if summary is None:
+        summary = StatsSummary()
+    if not os.path.exists(path):
+        return summary
+    rules_code = rules.pack() if rules is not None else None
+    for finished_at, seed, duration, moves, entry_rules_code, is_won in iterEntryFields(path, start):
+        if rules_code is not None and entry_rules_code != rules_code:
+            continue
+        if since is not None and finished_at < since:
+            continue
+        summary.add(is_won, duration, moves)
+    return summary
+
+
+def readCheckpoint(path):
+    # (entries count, summary) of checkpoint file, None when there is no valid one
+    try:
+        with open(path + CHECKPOINT_SUFFIX, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) != len(HEADER) + 4 + SUMMARY_FORMAT.size or not data.startswith(HEADER):
+        return None
+    count, = struct.unpack_from("<I", data, len(HEADER))
+    return count, StatsSummary.unpack(data[len(HEADER) + 4:])
+
+
+def writeCheckpoint(path, count, summary):
+    temp_path = path + CHECKPOINT_SUFFIX + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER + struct.pack("<I", count) + summary.pack())
+    os.replace(temp_path, path + CHECKPOINT_SUFFIX)
+
+
+def loadSummary(path):
+    # (entries count, summary) of the whole journal, folding only entries after the checkpoint
+    if not os.path.exists(path):
+        return 0, StatsSummary()
+    count = countEntries(path)
+    checkpoint = readCheckpoint(path)
+    if checkpoint is None or checkpoint[0] > count:
+        return count, summarize(path)
+    return count, summarize(path, start=checkpoint[0], summary=checkpoint[1])
+
+
+class StatsStore(BackgroundWriter):
+    def __init__(self, path, checkpoint_interval=CHECKPOINT_INTERVAL):
+        super().__init__()
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.count, self.summary = loadSummary(path)
+        self.file = None
+        self.written = 0
+        self.start()
+
+    def add(self, entry):
+        # aggregates are updated right away, the entry is written by the writer thread
+        self.summary.addEntry(entry)
+        self.count += 1
+        self.put((packEntry(entry), self.count, self.summary.pack()))
+
+    def openOutput(self):
+        is_new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, "ab")
+        if is_new_file:
+            self.file.write(HEADER)
+        else:
+            # drop partially written entry of interrupted write
+            self.file.truncate(len(HEADER) + countEntries(self.path) * ENTRY_FORMAT.size)
+
+    def writeItem(self, item):
+        data, count, summary_data = item
+        self.file.write(data)
+        self.file.flush()
+        self.written += 1
+        if self.written % self.checkpoint_interval == 0 or self.queue.empty():
+            writeCheckpoint(self.path, count, StatsSummary.unpack(summary_data))
+
+    def closeOutput(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def formatDuration(seconds):
+    return "{}:{:02d}".format(int(seconds) // 60, int(seconds) % 60)
+
+
+def formatSummary(summary):
+    return "\n".join([
+        "GAMES    {}".format(summary.games),
+        "WINS     {}".format(summary.wins),
+        "WIN RATE {:.1f}%".format(summary.getWinRate() * 100),
+        "STREAK   {}".format(summary.streak),
+        "BEST     {}".format(summary.best_streak),
+        "AVG TIME {}".format(formatDuration(summary.getAverageTime())),
+        "AVG WIN  {}".format(formatDuration(summary.getAverageWinTime())),
+        "AVG MOVE {:.0f}".format(summary.getAverageMoves()),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print statistics of finished games")
+    parser.add_argument("stats", nargs="?", default="stats.kds")
+    parser.add_argument("--draw", type=int, choices=[1, 3], default=None, help="only games of these rules")
+    parser.add_argument("--redeals", type=int, default=None)
+    parser.add_argument("--any-to-empty", action="store_true")
+    parser.add_argument("--days", type=float, default=None, help="only games of last days")
+    args = parser.parse_args()
+
+    rules = None
+    if args.draw is not None:
+        rules = Rules(args.draw, args.redeals, args.any_to_empty)
+    since = time.time() - args.days * 86400 if args.days is not None else None
+    if rules is None and since is None:
+        summary = loadSummary(args.stats)[1]
+    else:
+        summary = summarize(args.stats, rules, since)
+    print(formatSummary(summary))
+
+
+if __name__ == "__main__":
+    main()
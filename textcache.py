@@ -0,0 +1,95 @@
+import pyxel
+
+# Texts rendered once to an image bank, then every draw is one blt.
+# pyxel draws text to the screen only, so the top left corner of the screen is the scratch area:
+# prepare is called before a frame is drawn and the caller redraws the whole screen when it returns True.
+# Texts are packed in shelves from TEXT_AREA_V down, the area is cleared when it is full.
+TEXT_BANK = 1
+TEXT_AREA_V = 16  # resource sprites of bank 1 are above
+IMAGE_SIZE = 256
+CHAR_W = 4
+CHAR_H = 6
+COLKEY = 0
+OUTLINE_OFFSETS = [(1, 0), (0, 1), (-1, 0), (0, -1), (-1, -1), (-1, 1), (1, 1), (1, -1)]
+
+
+def calcTextSize(msg):
+    lines = msg.split("\n")
+    return max(len(line) for line in lines) * CHAR_W, len(lines) * CHAR_H
+
+
+class TextCache:
+    def __init__(self, bank=TEXT_BANK, area_v=TEXT_AREA_V):
+        self.bank = bank
+        self.area_v = area_v
+        self.entries = {}  # (msg, col, outline_col) -> (u, v, w, h)
+        self.widths = {}
+        self.shelf_u = 0
+        self.shelf_v = area_v
+        self.shelf_h = 0
+
+    def calcTextWidth(self, msg):
+        # widest line, the last line is not counted, like help screens were always centered
+        width = self.widths.get(msg)
+        if width is None:
+            lines = msg.split("\n")
+            if len(lines) > 1:
+                lines.pop()
+            width = max(len(line) for line in lines) * CHAR_W
+            self.widths[msg] = width
+        return width
+
+    def allocate(self, w, h):
+        if self.shelf_u + w > IMAGE_SIZE:
+            self.shelf_u = 0
+            self.shelf_v += self.shelf_h
+            self.shelf_h = 0
+        if self.shelf_v + h > IMAGE_SIZE:
+            # full, texts are rendered again when they are needed
+            self.entries.clear()
+            self.shelf_u = 0
+            self.shelf_v = self.area_v
+            self.shelf_h = 0
+        u = self.shelf_u
+        v = self.shelf_v
+        self.shelf_u += w
+        self.shelf_h = max(self.shelf_h, h)
+        return u, v
+
+    def prepare(self, msg, col, outline_col=None):
+        # renders text to image bank unless it is there, returns True when the screen was used for it
+        key = (msg, col, outline_col)
+        if key in self.entries:
+            return False
+
+        w, h = calcTextSize(msg)
+        border = 0 if outline_col is None else 1
+        w += 2 * border
+        h += 2 * border
+        pyxel.rect(0, 0, w, h, COLKEY)
+        if outline_col is not None:
+            for dx, dy in OUTLINE_OFFSETS:
+                pyxel.text(border + dx, border + dy, msg, outline_col)
+        pyxel.text(border, border, msg, col)
+
+        u, v = self.allocate(w, h)
+        rows = []
+        for y in range(h):
+            rows.append("".join("{:x}".format(pyxel.pget(x, y)) for x in range(w)))
+        pyxel.image(self.bank).set(u, v, rows)
+        self.entries[key] = (u, v, w, h)
+        return True
+
+    def draw(self, x, y, msg, col, outline_col=None):
+        entry = self.entries.get((msg, col, outline_col))
+        if entry is None:
+            # not prepared, drawn directly
+            if outline_col is not None:
+                for dx, dy in OUTLINE_OFFSETS:
+                    pyxel.text(x + dx, y + dy, msg, outline_col)
+            pyxel.text(x, y, msg, col)
+            return
+
+        u, v, w, h = entry
+        border = 0 if outline_col is None else 1
+        pyxel.blt(x - border, y - border, self.bank, u, v, w, h, COLKEY)
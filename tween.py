@@ -0,0 +1,105 @@
+# Pooled tweens of sprite offsets (offset_x, offset_y) relative to their layout position.
+# Slots are preallocated and reused: finished tween is swapped with the last active one,
+# so adding and advancing tweens allocates nothing. Every target keeps tween_index of its
+# slot (-1 when idle), so a new tween of the same target replaces the old one in place.
+
+DEFAULT_CAPACITY = 64
+
+
+def easeOut(t):
+    return 1 - (1 - t) * (1 - t)
+
+
+class TweenPool:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        self.targets = [None] * capacity
+        self.start_x = [0] * capacity
+        self.start_y = [0] * capacity
+        self.end_x = [0] * capacity
+        self.end_y = [0] * capacity
+        self.frames = [0] * capacity
+        self.delays = [0] * capacity
+        self.durations = [1] * capacity
+
+    def add(self, target, start_x, start_y, end_x, end_y, duration, delay=0):
+        index = target.tween_index
+        if index < 0:
+            if self.count == self.capacity:
+                # no free slot, target jumps to the end
+                target.offset_x = end_x
+                target.offset_y = end_y
+                return
+            index = self.count
+            self.count += 1
+            self.targets[index] = target
+            target.tween_index = index
+
+        self.start_x[index] = start_x
+        self.start_y[index] = start_y
+        self.end_x[index] = end_x
+        self.end_y[index] = end_y
+        self.frames[index] = 0
+        self.delays[index] = delay
+        self.durations[index] = max(1, duration)
+        target.offset_x = start_x
+        target.offset_y = start_y
+
+    def remove(self, index):
+        last = self.count - 1
+        self.targets[index].tween_index = -1
+        if index != last:
+            target = self.targets[last]
+            self.targets[index] = target
+            target.tween_index = index
+            self.start_x[index] = self.start_x[last]
+            self.start_y[index] = self.start_y[last]
+            self.end_x[index] = self.end_x[last]
+            self.end_y[index] = self.end_y[last]
+            self.frames[index] = self.frames[last]
+            self.delays[index] = self.delays[last]
+            self.durations[index] = self.durations[last]
+        self.targets[last] = None
+        self.count = last
+
+    def clear(self):
+        for index in range(self.count):
+            self.targets[index].tween_index = -1
+            self.targets[index] = None
+        self.count = 0
+
+    def finish(self):
+        # every target jumps to the end of its tween
+        for index in range(self.count):
+            target = self.targets[index]
+            target.offset_x = self.end_x[index]
+            target.offset_y = self.end_y[index]
+        self.clear()
+
+    def update(self):
+        # advances every tween by one frame, returns True while any tween is active
+        index = 0
+        while index < self.count:
+            frame = self.frames[index] + 1
+            self.frames[index] = frame
+            frame -= self.delays[index]
+            if frame <= 0:
+                index += 1
+                continue
+
+            target = self.targets[index]
+            duration = self.durations[index]
+            if frame >= duration:
+                target.offset_x = self.end_x[index]
+                target.offset_y = self.end_y[index]
+                self.remove(index)
+                continue
+
+            t = easeOut(frame / duration)
+            start_x = self.start_x[index]
+            start_y = self.start_y[index]
+            target.offset_x = int(start_x + (self.end_x[index] - start_x) * t)
+            target.offset_y = int(start_y + (self.end_y[index] - start_y) * t)
+            index += 1
+        return self.count > 0
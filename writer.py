@@ -0,0 +1,68 @@
+import queue
+import threading
+
+STOP = None
+
+
+class BackgroundWriter:
+    # Files written off the frame loop: put only queues an item, a daemon thread writes queued items in order.
+    # Subclasses open their file in openOutput, write one item in writeItem and close the file in closeOutput;
+    # an error of errors stops writing and is kept in error.
+    errors = (OSError,)
+    is_latest_only = False  # items queued behind a newer one are skipped
+
+    def __init__(self):
+        self.error = None
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.writeLoop, daemon=True)
+
+    def start(self):
+        # called by subclasses once they are set up, the thread uses their attributes
+        self.thread.start()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def openOutput(self):
+        pass
+
+    def writeItem(self, item):
+        raise NotImplementedError
+
+    def closeOutput(self):
+        pass
+
+    def getItem(self):
+        item = self.queue.get()
+        if not self.is_latest_only:
+            return item
+        while item is not STOP and not self.queue.empty():
+            newer = self.queue.get()
+            if newer is STOP:
+                # latest item is still written, stop is put back for the next get
+                self.queue.put(STOP)
+                break
+            item = newer
+        return item
+
+    def writeLoop(self):
+        try:
+            self.openOutput()
+            while True:
+                item = self.getItem()
+                if item is STOP:
+                    break
+                self.writeItem(item)
+        except self.errors as error:
+            self.error = error
+        finally:
+            try:
+                self.closeOutput()
+            except self.errors:
+                pass
+
+    def close(self):
+        # waits for queued items to be written
+        if self.thread.is_alive():
+            self.queue.put(STOP)
+            self.thread.join()